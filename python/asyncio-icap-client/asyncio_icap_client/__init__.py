@@ -1,9 +1,12 @@
 from .client import ICAPClient
-from .connection import ICAPConnection
+from .connection import ConnectionState, ICAPConnection
 from .errors import (
+    ConnectionClosedError,
     EmptyEncapsulatedHeaderError,
     EncapsulatedBodyMissingError,
     EncapsulatedHeaderMissingError,
+    ICAPConnectionUnusableError,
+    ICAPPoolClosedError,
     InvalidChunkSizeError,
     InvalidChunkTerminatorError,
     InvalidEncapsulatedEntityOffsetError,
@@ -13,17 +16,25 @@ from .errors import (
     InvalidProtocolError,
     InvalidStatusCodeError,
     InvalidStatusLineError,
+    StaleConnectionError,
 )
+from .options import ICAPOptionsCache, ICAPServiceOptions
+from .pool import ICAPConnectionPool
 from .request import ICAPRequest, RequestBody, RequestMethod
-from .response import ICAPResponse, ResponseBody
+from .response import ICAPResponse, ICAPResponseStream, ResponseBody
 
 __all__ = [
     "ICAPClient",
     "ICAPConnection",
+    "ConnectionState",
+    "ICAPConnectionPool",
+    "ICAPOptionsCache",
+    "ICAPServiceOptions",
     "ICAPRequest",
     "RequestMethod",
     "RequestBody",
     "ICAPResponse",
+    "ICAPResponseStream",
     "ResponseBody",
     "InvalidStatusLineError",
     "InvalidProtocolError",
@@ -37,4 +48,8 @@ __all__ = [
     "EncapsulatedBodyMissingError",
     "InvalidChunkSizeError",
     "InvalidChunkTerminatorError",
+    "ICAPPoolClosedError",
+    "ConnectionClosedError",
+    "StaleConnectionError",
+    "ICAPConnectionUnusableError",
 ]
@@ -2,3 +2,4 @@ from typing import Final
 
 ICAP_VERSION: Final[bytes] = b"ICAP/1.0"
 NEWLINE: Final[bytes] = b"\r\n"
+CONTINUE_STATUS: Final[int] = 100
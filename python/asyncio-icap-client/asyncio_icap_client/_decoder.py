@@ -2,7 +2,7 @@ import itertools
 from enum import Enum, auto
 from typing import Dict, List, Optional, Tuple, TypeVar, Union
 
-from ._constants import ICAP_VERSION, NEWLINE
+from ._constants import CONTINUE_STATUS, ICAP_VERSION, NEWLINE
 from ._sections import SectionType
 from .errors import (
     EmptyEncapsulatedHeaderError,
@@ -30,11 +30,24 @@ INCOMPLETE = Incomplete()
 T = TypeVar("T")
 IncompleteOr = Union[Incomplete, T]
 
+# Decoded data is removed from the start of the buffer once at least this many
+# bytes have been decoded and they make up at least half of the buffer. This
+# keeps the cost of the removals linear in the size of the response.
+COMPACTION_THRESHOLD = 64 * 1024
+
+CHUNKED_SECTIONS = frozenset(
+    {SectionType.RequestBody, SectionType.ResponseBody, SectionType.OptionsBody}
+)
+HEADER_SECTIONS = frozenset({SectionType.RequestHeaders, SectionType.ResponseHeaders})
+
 
 class ICAPDecoderState(Enum):
     DECODING_STATUS_LINE = auto()
     DECODING_HEADERS = auto()
     DECODING_SECTIONS = auto()
+    # Used only when the body is decoded separately from the head
+    DECODING_BODY = auto()
+    BODY_DECODED = auto()
 
 
 class ICAPResponseDecoder:
@@ -44,6 +57,10 @@ class ICAPResponseDecoder:
     _headers: Dict[str, str]
     _sections: List[Tuple[SectionType, Optional[int]]]
     _chunked_body: bytearray
+    # Number of bytes of the current chunk not yet decoded, or None if the
+    # size of the next chunk has not been decoded yet
+    _chunk_remaining: Optional[int]
+    _last_chunk: bool
     _encapsulated_request_headers: Optional[bytes]
     _encapsulated_response_headers: Optional[bytes]
     _encapsulated_request_body: Optional[bytes]
@@ -52,12 +69,98 @@ class ICAPResponseDecoder:
 
     def __init__(self) -> None:
         self._buffer = bytearray()
+        # Offset of the first byte of the buffer that has not been decoded
+        self._position = 0
         self._reset_state()
 
     def feed(self, data: bytes) -> None:
-        self._buffer.extend(data)
+        self._compact()
+        if self._chunk_remaining and not self._buffer:
+            # Data of the chunk being decoded bypasses the buffer.
+            if len(data) <= self._chunk_remaining:
+                self._chunked_body += data
+                self._chunk_remaining -= len(data)
+                return
+        self._buffer += data
+
+    def _compact(self) -> None:
+        if self._position == len(self._buffer):
+            self._buffer.clear()
+            self._position = 0
+        elif self._position >= COMPACTION_THRESHOLD and self._position * 2 >= len(
+            self._buffer
+        ):
+            del self._buffer[: self._position]
+            self._position = 0
+
+    @property
+    def has_pending_data(self) -> bool:
+        """Whether data has been fed that does not belong to a decoded
+        response"""
+        return (
+            self._position < len(self._buffer)
+            or self._state is not ICAPDecoderState.DECODING_STATUS_LINE
+        )
+
+    @property
+    def decoding_body(self) -> bool:
+        """Whether the body of a response decoded with `decode_head` follows"""
+        return self._state in {
+            ICAPDecoderState.DECODING_BODY,
+            ICAPDecoderState.BODY_DECODED,
+        }
 
     def decode_response(self) -> IncompleteOr[ICAPResponse]:
+        if isinstance(self._decode_head(), Incomplete):
+            return INCOMPLETE
+        if self._state is ICAPDecoderState.DECODING_SECTIONS:
+            if isinstance(self._decode_sections(), Incomplete):
+                return INCOMPLETE
+        response = self._make_response()
+        self._reset_state()
+        return response
+
+    def decode_head(self) -> IncompleteOr[ICAPResponse]:
+        """Decode a response up to its encapsulated body.
+
+        The body of the response is decoded with `decode_body` after this.
+        """
+        if isinstance(self._decode_head(), Incomplete):
+            return INCOMPLETE
+        if self._state is ICAPDecoderState.DECODING_SECTIONS:
+            if isinstance(self._decode_sections(stop_at_body=True), Incomplete):
+                return INCOMPLETE
+        response = self._make_response()
+        if self._sections:
+            self._state = ICAPDecoderState.DECODING_BODY
+        else:
+            self._reset_state()
+        return response
+
+    def decode_body(self) -> IncompleteOr[Optional[bytes]]:
+        """Decode the next part of the body of a response decoded with
+        `decode_head`.
+
+        Returns None once the whole body has been decoded.
+        """
+        if self._state is ICAPDecoderState.BODY_DECODED:
+            self._reset_state()
+            return None
+        if self._state is not ICAPDecoderState.DECODING_BODY:
+            return None
+        complete = not isinstance(self._decode_chunked_body(), Incomplete)
+        if self._chunked_body:
+            data = bytes(self._chunked_body)
+            self._chunked_body.clear()
+            if complete:
+                self._state = ICAPDecoderState.BODY_DECODED
+            return data
+        if complete:
+            self._reset_state()
+            return None
+        return INCOMPLETE
+
+    def _decode_head(self) -> IncompleteOr[None]:
         if self._state is ICAPDecoderState.DECODING_STATUS_LINE:
             if isinstance(self._decode_status_line(), Incomplete):
                 return INCOMPLETE
@@ -66,11 +169,11 @@ class ICAPResponseDecoder:
             if isinstance(self._decode_headers(), Incomplete):
                 return INCOMPLETE
             self._state = ICAPDecoderState.DECODING_SECTIONS
-        if self._state is ICAPDecoderState.DECODING_SECTIONS:
-            if isinstance(self._decode_sections(), Incomplete):
-                return INCOMPLETE
+        return None
+
+    def _make_response(self) -> ICAPResponse:
         assert self._status is not None and self._reason is not None
-        response = ICAPResponse(
+        return ICAPResponse(
             status=self._status,
             reason=self._reason,
             headers=self._headers,
@@ -80,8 +183,6 @@ class ICAPResponseDecoder:
             encapsulated_response_body=self._encapsulated_response_body,
             options_body=self._options_body,
         )
-        self._reset_state()
-        return response
 
     def _decode_status_line(self) -> IncompleteOr[None]:
         line = self._decode_line()
@@ -103,19 +204,21 @@ class ICAPResponseDecoder:
         return None
 
     def _decode_line(self) -> IncompleteOr[bytes]:
-        newline = self._buffer.find(NEWLINE)
+        newline = self._buffer.find(NEWLINE, self._position)
         if newline == -1:
             return INCOMPLETE
-        line = self._buffer[0:newline]
-        del self._buffer[0 : newline + len(NEWLINE)]
+        line = bytes(self._buffer[self._position : newline])
+        self._position = newline + len(NEWLINE)
         return line
 
     def _decode_headers(self) -> IncompleteOr[None]:
-        while not self._buffer.startswith(NEWLINE):
+        while not self._buffer.startswith(NEWLINE, self._position):
             if isinstance(self._decode_header(), Incomplete):
                 return INCOMPLETE
         assert not isinstance(self._decode_line(), Incomplete)
-        self._decode_encapsulated()
+        # Interim responses to previews have no encapsulated sections.
+        if self._status != CONTINUE_STATUS:
+            self._decode_encapsulated()
         return None
 
     def _decode_header(self) -> IncompleteOr[None]:
@@ -169,35 +272,39 @@ class ICAPResponseDecoder:
                 self._sections.append((section1, offset2 - offset1))
         return None
 
-    def _decode_sections(self) -> IncompleteOr[None]:
+    def _decode_sections(self, stop_at_body: bool = False) -> IncompleteOr[None]:
         while self._sections:
             section, size = self._sections[0]
-            if section in {
-                SectionType.RequestBody,
-                SectionType.ResponseBody,
-                SectionType.OptionsBody,
-            }:
+            if section in CHUNKED_SECTIONS:
                 assert size is None
+                if stop_at_body:
+                    return None
                 if isinstance(self._decode_chunked_body(), Incomplete):
                     return INCOMPLETE
+                body = bytes(self._chunked_body)
+                if section is SectionType.RequestBody:
+                    self._encapsulated_request_body = body
+                elif section is SectionType.ResponseBody:
+                    self._encapsulated_response_body = body
+                elif section is SectionType.OptionsBody:
+                    self._options_body = body
+                else:
+                    assert False
                 self._sections.pop(0)
-            elif section in {
-                SectionType.RequestHeaders,
-                SectionType.ResponseHeaders,
-            }:
+            elif section in HEADER_SECTIONS:
                 assert size is not None
-                if len(self._buffer) < size:
+                if len(self._buffer) - self._position < size:
                     return INCOMPLETE
-                data = self._buffer[0:size]
-                del self._buffer[0:size]
+                data = bytes(self._buffer[self._position : self._position + size])
+                self._position += size
                 if section is SectionType.RequestHeaders:
-                    self._encapsulated_request_headers = bytes(data)
+                    self._encapsulated_request_headers = data
                 elif section is SectionType.ResponseHeaders:
-                    self._encapsulated_response_headers = bytes(data)
+                    self._encapsulated_response_headers = data
                 else:
                     assert False
                 self._sections.pop(0)
-            elif section in {SectionType.NullBody}:
+            elif section is SectionType.NullBody:
                 self._sections.pop(0)
             else:
                 assert False
@@ -207,40 +314,50 @@ class ICAPResponseDecoder:
         # TODO: Support chunk extensions and trailers
         assert len(self._sections) == 1
         while True:
-            newline = self._buffer.find(NEWLINE)
-            if newline == -1:
-                return INCOMPLETE
-            chunk_content_start = newline + len(NEWLINE)
-            try:
-                chunk_size = int(self._buffer[0:newline], 16)
-            except ValueError as err:
-                raise InvalidChunkSizeError() from err
-            if chunk_size < 0:
-                raise InvalidChunkSizeError()
-            chunk_content_end = chunk_content_start + chunk_size
-            bytes_required = chunk_content_end + len(NEWLINE)
-            if len(self._buffer) < bytes_required:
+            if self._chunk_remaining is None:
+                if isinstance(self._decode_chunk_size(), Incomplete):
+                    return INCOMPLETE
+                assert self._chunk_remaining is not None
+            if self._chunk_remaining > 0:
+                # Chunk data is copied straight from the buffer as it arrives,
+                # so the buffer does not grow to the size of the chunk.
+                available = min(
+                    len(self._buffer) - self._position, self._chunk_remaining
+                )
+                if available:
+                    # The view must be released before the buffer can be
+                    # resized.
+                    with memoryview(self._buffer) as view:
+                        self._chunked_body += view[
+                            self._position : self._position + available
+                        ]
+                    self._position += available
+                    self._chunk_remaining -= available
+                if self._chunk_remaining > 0:
+                    return INCOMPLETE
+            if len(self._buffer) - self._position < len(NEWLINE):
                 return INCOMPLETE
-            if (
-                self._buffer[chunk_content_end : chunk_content_end + len(NEWLINE)]
-                != NEWLINE
-            ):
+            if not self._buffer.startswith(NEWLINE, self._position):
                 raise InvalidChunkTerminatorError()
-            data = self._buffer[chunk_content_start:chunk_content_end]
-            del self._buffer[0:bytes_required]
-            if chunk_size == 0:  # This is the last chunk
-                section, _ = self._sections[0]
-                if section is SectionType.RequestBody:
-                    self._encapsulated_request_body = bytes(self._chunked_body)
-                elif section is SectionType.ResponseBody:
-                    self._encapsulated_response_body = bytes(self._chunked_body)
-                elif section is SectionType.OptionsBody:
-                    self._options_body = bytes(self._chunked_body)
-                else:
-                    assert False
+            self._position += len(NEWLINE)
+            self._chunk_remaining = None
+            if self._last_chunk:
                 return None
-            else:
-                self._chunked_body.extend(data)
+
+    def _decode_chunk_size(self) -> IncompleteOr[None]:
+        newline = self._buffer.find(NEWLINE, self._position)
+        if newline == -1:
+            return INCOMPLETE
+        try:
+            chunk_size = int(self._buffer[self._position : newline], 16)
+        except ValueError as err:
+            raise InvalidChunkSizeError() from err
+        if chunk_size < 0:
+            raise InvalidChunkSizeError()
+        self._position = newline + len(NEWLINE)
+        self._chunk_remaining = chunk_size
+        self._last_chunk = chunk_size == 0
+        return None
 
     def _reset_state(self) -> None:
         self._state = ICAPDecoderState.DECODING_STATUS_LINE
@@ -249,6 +366,8 @@ class ICAPResponseDecoder:
         self._headers = {}
         self._sections = []
         self._chunked_body = bytearray()
+        self._chunk_remaining = None
+        self._last_chunk = False
         self._encapsulated_request_headers = None
         self._encapsulated_response_headers = None
         self._encapsulated_request_body = None
@@ -1,25 +1,53 @@
 import asyncio
 import urllib.parse
-from typing import Dict, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from ._constants import ICAP_VERSION, NEWLINE
 from ._sections import SectionType
 from .async_readable import AsyncReadable
 from .request import ICAPRequest, RequestMethod
 
+# Size of the first read from a file body. Reads grow up to the maximum chunk
+# size as long as the file fills them.
+INITIAL_CHUNK_SIZE = 16 * 1024
+DEFAULT_MAX_CHUNK_SIZE = 1024 * 1024
+# The writer is drained only when more than this many bytes are waiting to be
+# sent, so that small writes do not wait for the transport.
+DEFAULT_HIGH_WATER_MARK = 256 * 1024
+
+LAST_CHUNK = b"0" + NEWLINE + NEWLINE
+# Last chunk of a preview that contains the whole body
+LAST_CHUNK_IEOF = b"0; ieof" + NEWLINE + NEWLINE
+
+Data = Union[bytes, memoryview]
+
 
 class ICAPRequestEncoder:
-    def __init__(self, host: str, port: int, writer: asyncio.StreamWriter):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        writer: asyncio.StreamWriter,
+        *,
+        max_chunk_size: int = DEFAULT_MAX_CHUNK_SIZE,
+        high_water_mark: int = DEFAULT_HIGH_WATER_MARK,
+    ):
         self._host = host
         self._port = port
         self._writer = writer
+        self._max_chunk_size = max_chunk_size
+        self._high_water_mark = high_water_mark
+        # Data waiting to be passed to the writer in a single call
+        self._pending: List[Data] = []
+        # Body data following a preview and the file it is read from
+        self._remaining_body: Optional[Tuple[Data, Optional[AsyncReadable]]] = None
 
-    async def _send_request_line(
+    def _encode_request_line(
         self,
         method: RequestMethod,
         path: Optional[str],
         params: Dict[str, str],
-    ) -> None:
+    ) -> bytes:
         full_url = urllib.parse.urlunparse(
             (
                 "icap",  # protocol
@@ -30,77 +58,139 @@ class ICAPRequestEncoder:
                 "",  # fragment
             )
         )
-        self._writer.write(
-            b"%b %b %b%b"
-            % (
-                method.value.encode("ascii"),
-                full_url.encode("ascii"),
-                ICAP_VERSION,
-                NEWLINE,
-            )
+        return b"%b %b %b%b" % (
+            method.value.encode("ascii"),
+            full_url.encode("ascii"),
+            ICAP_VERSION,
+            NEWLINE,
+        )
+
+    def _encode_headers(self, headers: Dict[str, str]) -> bytes:
+        return b"".join(
+            b"%b: %b%b" % (header.encode("ascii"), value.encode("ascii"), NEWLINE)
+            for header, value in headers.items()
         )
-        await self._writer.drain()
-
-    async def _send_headers(self, headers: Dict[str, str]) -> None:
-        for header, value in headers.items():
-            self._writer.write(
-                b"%b: %b%b"
-                % (
-                    header.encode("ascii"),
-                    value.encode("ascii"),
-                    NEWLINE,
-                )
-            )
-        self._writer.write(NEWLINE)
-        await self._writer.drain()
 
-    async def _send_data(self, data: bytes) -> None:
-        self._writer.write(data)
-        await self._writer.drain()
+    def _write(self, data: Data) -> None:
+        self._pending.append(data)
 
-    async def _send_chunk(self, data: bytes) -> None:
-        self._writer.write(b"%x%b" % (len(data), NEWLINE))
-        self._writer.write(data)
-        self._writer.write(NEWLINE)
-        await self._writer.drain()
+    def _write_chunk(self, data: Data) -> None:
+        if data:
+            self._pending.extend((b"%x%b" % (len(data), NEWLINE), data, NEWLINE))
 
-    async def _send_terminating_chunk(self) -> None:
-        await self._send_chunk(b"")
+    async def _flush(self) -> None:
+        if self._pending:
+            self._writer.writelines(self._pending)
+            self._pending = []
+        if self._writer.transport.get_write_buffer_size() > self._high_water_mark:
+            await self._writer.drain()
 
     async def _send_file(self, handle: AsyncReadable) -> None:
-        chunk_size = 4096
+        chunk_size = min(INITIAL_CHUNK_SIZE, self._max_chunk_size)
         while True:
             data = await handle.read(chunk_size)
             if not data:
                 return
-            await self._send_chunk(data)
+            self._write_chunk(data)
+            # The first chunk is sent together with the headers.
+            await self._flush()
+            if len(data) >= chunk_size:
+                chunk_size = min(2 * chunk_size, self._max_chunk_size)
 
-    async def _send_chunked_section(self, data: Union[bytes, AsyncReadable]) -> None:
+    async def _read_preview(self, handle: AsyncReadable, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            read = await handle.read(size - len(data))
+            if not read:
+                break
+            data += read
+        return bytes(data)
+
+    async def _send_chunked_section(
+        self,
+        data: Union[bytes, AsyncReadable],
+        preview: Optional[int],
+    ) -> bool:
+        if preview is not None:
+            return await self._send_preview(data, preview)
         if isinstance(data, bytes):
-            await self._send_chunk(data)
+            self._write_chunk(data)
         elif isinstance(data, AsyncReadable):
             await self._send_file(data)
-        await self._send_terminating_chunk()
+        self._write(LAST_CHUNK)
+        return True
 
-    async def send_request(self, request: ICAPRequest) -> None:
-        await self._send_request_line(
-            request.method,
-            request.path,
-            request.params,
+    async def _send_preview(
+        self,
+        data: Union[bytes, AsyncReadable],
+        preview: int,
+    ) -> bool:
+        handle = None
+        if isinstance(data, AsyncReadable):
+            handle = data
+            # One byte more than the preview is read to tell whether the
+            # preview contains the whole body.
+            data = await self._read_preview(handle, preview + 1)
+        if len(data) <= preview:
+            self._write_chunk(data)
+            self._write(LAST_CHUNK_IEOF)
+            return True
+        view = memoryview(data)
+        self._write_chunk(view[:preview])
+        self._write(LAST_CHUNK)
+        self._remaining_body = (view[preview:], handle)
+        return False
+
+    async def send_remaining_body(self) -> None:
+        """Send the rest of a body after a preview of it has been sent"""
+        assert self._remaining_body is not None
+        data, handle = self._remaining_body
+        self._remaining_body = None
+        self._write_chunk(data)
+        if handle is not None:
+            await self._send_file(handle)
+        self._write(LAST_CHUNK)
+        await self._flush()
+
+    def discard_remaining_body(self) -> None:
+        self._remaining_body = None
+
+    async def send_request(self, request: ICAPRequest) -> bool:
+        """Send a request.
+
+        Returns False if only a preview of the body was sent, in which case
+        the rest is sent with `send_remaining_body` if the server responds
+        with 100 Continue.
+        """
+        body = (
+            request.encapsulated_request_body
+            if request.encapsulated_request_body is not None
+            else request.encapsulated_response_body
+        )
+        preview = request.preview if body is not None else None
+        self._write(
+            self._encode_request_line(
+                request.method,
+                request.path,
+                request.params,
+            )
         )
         headers = dict(request.headers)
+        if preview is not None:
+            headers["Preview"] = str(preview)
         headers["Encapsulated"] = self._make_encapsulated_header(request)
-        await self._send_headers(headers)
+        self._write(self._encode_headers(headers) + NEWLINE)
         if request.encapsulated_request_headers is not None:
-            await self._send_data(request.encapsulated_request_headers)
+            self._write(request.encapsulated_request_headers)
         if request.encapsulated_response_headers is not None:
-            await self._send_data(request.encapsulated_response_headers)
-        if request.encapsulated_request_body is not None:
-            await self._send_chunked_section(request.encapsulated_request_body)
-        if request.encapsulated_response_body is not None:
-            await self._send_chunked_section(request.encapsulated_response_body)
+            self._write(request.encapsulated_response_headers)
+        complete = True
+        if body is not None:
+            complete = await self._send_chunked_section(body, preview)
         if request.options_body is not None:
-            await self._send_chunked_section(request.options_body)
+            await self._send_chunked_section(request.options_body, None)
+        await self._flush()
+        return complete
 
     def _make_encapsulated_header(self, request: ICAPRequest) -> str:
         fields = []
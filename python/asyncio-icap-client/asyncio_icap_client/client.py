@@ -2,7 +2,9 @@ import asyncio
 from types import TracebackType
 from typing import Dict, Optional, Type
 
+from ._encoder import DEFAULT_MAX_CHUNK_SIZE
 from .connection import ICAPConnection
+from .options import ICAPOptionsCache
 
 DEFAULT_ICAP_PORT = 1344
 
@@ -14,10 +16,18 @@ class ICAPClient:
         port: int = DEFAULT_ICAP_PORT,
         *,
         headers: Optional[Dict[str, str]] = None,
+        max_chunk_size: int = DEFAULT_MAX_CHUNK_SIZE,
+        preview: bool = False,
+        allow_204: bool = False,
+        options_cache: Optional[ICAPOptionsCache] = None,
     ):
         self.host = host
         self.port = port
         self.headers = headers
+        self.max_chunk_size = max_chunk_size
+        self.preview = preview
+        self.allow_204 = allow_204
+        self.options_cache = options_cache
         self._connection: Optional[ICAPConnection] = None
 
     async def connect(self) -> ICAPConnection:
@@ -29,6 +39,10 @@ class ICAPClient:
             reader,
             writer,
             headers=self.headers,
+            max_chunk_size=self.max_chunk_size,
+            preview=self.preview,
+            allow_204=self.allow_204,
+            options_cache=self.options_cache,
         )
         return self._connection
 
@@ -1,11 +1,42 @@
 import asyncio
-from typing import Dict, Optional
+import contextlib
+import dataclasses
+import functools
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
 
-from ._decoder import ICAPResponseDecoder, Incomplete
-from ._encoder import ICAPRequestEncoder
-from .errors import ICAPProtocolError
+from ._constants import CONTINUE_STATUS
+from ._decoder import ICAPResponseDecoder, Incomplete, IncompleteOr
+from ._encoder import DEFAULT_MAX_CHUNK_SIZE, ICAPRequestEncoder
+from .errors import (
+    ConnectionClosedError,
+    ICAPConnectionUnusableError,
+    ICAPProtocolError,
+    StaleConnectionError,
+)
+from .options import ICAPOptionsCache, ICAPServiceOptions
 from .request import ICAPRequest, RequestBody, RequestMethod
-from .response import ICAPResponse
+from .response import ICAPResponse, ICAPResponseStream
+
+# Maximum number of bytes read from the server at once
+READ_SIZE = 64 * 1024
+
+T = TypeVar("T")
+
+OptionsFetcher = Callable[[Optional[str]], Awaitable[ICAPResponse]]
+
+
+class ConnectionState(Enum):
+    # Ready for a request
+    IDLE = "idle"
+    # A request is in progress
+    BUSY = "busy"
+    # The connection cannot be used for further requests, because a request
+    # failed or was cancelled midway, the server closed the connection or
+    # asked for it to be closed, or the response was followed by unexpected
+    # data.
+    POISONED = "poisoned"
+    CLOSED = "closed"
 
 
 class ICAPConnection:
@@ -17,44 +48,204 @@ class ICAPConnection:
         writer: asyncio.StreamWriter,
         *,
         headers: Optional[Dict[str, str]] = None,
+        max_chunk_size: int = DEFAULT_MAX_CHUNK_SIZE,
+        preview: bool = False,
+        allow_204: bool = False,
+        options_cache: Optional[ICAPOptionsCache] = None,
+        fetch_options: Optional[OptionsFetcher] = None,
     ):
+        self._host = host
+        self._port = port
         self._reader = reader
         self._writer = writer
         self._headers = headers
+        self._preview = preview
+        self._allow_204 = allow_204
+        # This can be shared between connections.
+        self._owns_options_cache = options_cache is None
+        self.options_cache = (
+            options_cache if options_cache is not None else ICAPOptionsCache()
+        )
+        # Options missing from the cache are fetched in the background with
+        # this, by default on this connection once it is free.
+        self._fetch_options = (
+            fetch_options if fetch_options is not None else self.options
+        )
         self._decoder = ICAPResponseDecoder()
-        self._encoder = ICAPRequestEncoder(host, port, self._writer)
+        self._encoder = ICAPRequestEncoder(
+            host, port, self._writer, max_chunk_size=max_chunk_size
+        )
         self._request_lock = asyncio.Lock()
+        self._state = ConnectionState.IDLE
+        # Number of responses received on the connection
+        self._responses = 0
+        # Whether any part of a response to the current request was received
+        self._response_started = False
 
     def _prepare_request(self, request: ICAPRequest) -> ICAPRequest:
         if self._headers is None:
             return request
         headers = dict(self._headers)
         headers.update(request.headers)
-        return ICAPRequest(
-            method=request.method,
-            path=request.path,
-            params=request.params,
-            headers=headers,
-            encapsulated_request_headers=request.encapsulated_request_headers,
-            encapsulated_response_headers=request.encapsulated_response_headers,
-            encapsulated_request_body=request.encapsulated_request_body,
-            encapsulated_response_body=request.encapsulated_response_body,
-            options_body=request.options_body,
+        return dataclasses.replace(request, headers=headers)
+
+    def _apply_options(self, request: ICAPRequest) -> ICAPRequest:
+        """Use a preview and allow 204 responses if the service supports them.
+
+        Requests are sent without either while the options of the service are
+        not cached, so requests never wait for OPTIONS requests.
+        """
+        if request.method is RequestMethod.OPTIONS or not (
+            self._preview or self._allow_204
+        ):
+            return request
+        options = self._get_options(request.path)
+        if options is None:
+            return request
+        changes: Dict[str, Any] = {}
+        has_body = (
+            request.encapsulated_request_body is not None
+            or request.encapsulated_response_body is not None
         )
+        if (
+            self._preview
+            and has_body
+            and request.preview is None
+            and options.preview is not None
+        ):
+            changes["preview"] = options.preview
+        if self._allow_204 and options.allow_204:
+            changes["headers"] = {"Allow": "204", **request.headers}
+        return dataclasses.replace(request, **changes) if changes else request
+
+    def _get_options(self, path: Optional[str]) -> Optional[ICAPServiceOptions]:
+        key = (self._host, self._port, path)
+        if self.options_cache.needs_fetch(key):
+            self.options_cache.refresh_in_background(
+                key, functools.partial(self._fetch_options, path)
+            )
+        return self.options_cache.get(key)
+
+    @property
+    def state(self) -> ConnectionState:
+        return self._state
+
+    @property
+    def is_reusable(self) -> bool:
+        """Whether the connection can be used for further requests"""
+        return (
+            self._state is ConnectionState.IDLE
+            and not self._writer.is_closing()
+            and not self._reader.at_eof()
+        )
+
+    @contextlib.asynccontextmanager
+    async def _transaction(self) -> AsyncIterator[None]:
+        async with self._request_lock:
+            if self._state is not ConnectionState.IDLE:
+                raise ICAPConnectionUnusableError(self._state.value)
+            self._state = ConnectionState.BUSY
+            self._response_started = False
+            try:
+                yield
+            except (
+                ConnectionClosedError,
+                ConnectionResetError,
+                BrokenPipeError,
+            ) as err:
+                self._state = ConnectionState.POISONED
+                # A connection closed by the server before responding to the
+                # first request sent after it was reused was most likely
+                # closed while idle, and the request was not processed.
+                if self._responses > 0 and not self._response_started:
+                    raise StaleConnectionError() from err
+                raise
+            except BaseException:
+                # The connection is left in an unknown state if the request
+                # fails or is cancelled midway.
+                self._state = ConnectionState.POISONED
+                raise
+            self._responses += 1
+            if self._state is ConnectionState.BUSY:
+                # Data following the response cannot belong to any request.
+                if self._decoder.has_pending_data:
+                    self._state = ConnectionState.POISONED
+                else:
+                    self._state = ConnectionState.IDLE
 
     async def request(self, request: ICAPRequest) -> ICAPResponse:
-        chunk_size = 4096
         request = self._prepare_request(request)
-        async with self._request_lock:
-            await self._encoder.send_request(request)
-            while True:
-                data = await self._reader.read(chunk_size)
-                if not data:
-                    raise ICAPProtocolError()
-                self._decoder.feed(data)
-                response = self._decoder.decode_response()
-                if not isinstance(response, Incomplete):
-                    return response
+        async with self._transaction():
+            response = await self._exchange(
+                self._apply_options(request), self._decoder.decode_response
+            )
+            if _has_connection_close(response):
+                self._state = ConnectionState.POISONED
+        if request.method is RequestMethod.OPTIONS:
+            key = (self._host, self._port, request.path)
+            if response.status == 200:
+                self.options_cache.put(key, response)
+            else:
+                self.options_cache.put_failure(key)
+        return response
+
+    async def _exchange(
+        self,
+        request: ICAPRequest,
+        decode: Callable[[], IncompleteOr[ICAPResponse]],
+    ) -> ICAPResponse:
+        complete = await self._encoder.send_request(request)
+        response = await self._receive(decode)
+        if response.status == CONTINUE_STATUS:
+            if complete:
+                raise ICAPProtocolError()
+            await self._encoder.send_remaining_body()
+            response = await self._receive(decode)
+        elif not complete:
+            # The server responded to the preview without the rest of the
+            # body, which is then not sent at all.
+            self._encoder.discard_remaining_body()
+        return response
+
+    @contextlib.asynccontextmanager
+    async def stream(self, request: ICAPRequest) -> AsyncIterator[ICAPResponseStream]:
+        """Send a request and receive the response body as it is read.
+
+        Only as much of the body is buffered as has been received but not yet
+        read, so large bodies are not held in memory. The connection is not
+        reused if the body has not been read completely when the context
+        exits.
+        """
+        request = self._prepare_request(request)
+        async with self._transaction():
+            head = await self._exchange(
+                self._apply_options(request), self._decoder.decode_head
+            )
+            response = ICAPResponseStream(
+                head,
+                self._receive_body() if self._decoder.decoding_body else None,
+            )
+            yield response
+            if not response.complete or _has_connection_close(head):
+                self._state = ConnectionState.POISONED
+
+    async def _receive_body(self) -> AsyncIterator[bytes]:
+        while True:
+            data = await self._receive(self._decoder.decode_body)
+            if data is None:
+                return
+            yield data
+
+    async def _receive(self, decode: Callable[[], IncompleteOr[T]]) -> T:
+        while True:
+            result = decode()
+            if not isinstance(result, Incomplete):
+                return result
+            data = await self._reader.read(READ_SIZE)
+            if not data:
+                raise ConnectionClosedError()
+            self._response_started = True
+            self._decoder.feed(data)
 
     async def reqmod(
         self,
@@ -111,5 +302,15 @@ class ICAPConnection:
         return await self.request(request)
 
     async def close(self) -> None:
+        self._state = ConnectionState.CLOSED
         self._writer.close()
         await self._writer.wait_closed()
+        if self._owns_options_cache:
+            await self.options_cache.close()
+
+
+def _has_connection_close(response: ICAPResponse) -> bool:
+    value = response.get_header("Connection")
+    if value is None:
+        return False
+    return "close" in (option.strip().lower() for option in value.split(","))
@@ -2,6 +2,18 @@ class ICAPProtocolError(Exception):
     """ICAP protocol error"""
 
 
+class ConnectionClosedError(ICAPProtocolError):
+    """Connection was closed before a complete response was received"""
+
+
+class StaleConnectionError(ConnectionClosedError):
+    """Reused connection was closed before the request was responded to.
+
+    The server most likely closed the connection while it was idle, without
+    processing the request.
+    """
+
+
 class InvalidStatusLineError(ICAPProtocolError):
     pass
 
@@ -52,3 +64,11 @@ class InvalidChunkTerminatorError(ICAPProtocolError):
 
 class InvalidSectionsError(ICAPProtocolError):
     pass
+
+
+class ICAPPoolClosedError(Exception):
+    """ICAP connection pool has been closed"""
+
+
+class ICAPConnectionUnusableError(Exception):
+    """ICAP connection cannot be used for further requests"""
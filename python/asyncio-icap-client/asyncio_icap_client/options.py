@@ -0,0 +1,187 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from .response import ICAPResponse
+
+# Share of the Options-TTL after which cached options are refreshed in the
+# background, before they expire
+REFRESH_RATIO = 0.8
+# Time in seconds before options are fetched again after fetching them failed,
+# doubling after each consecutive failure up to the maximum
+FAILURE_BACKOFF = 5.0
+MAX_FAILURE_BACKOFF = 300.0
+
+ServiceKey = Tuple[str, int, Optional[str]]
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    return number if number >= 0 else None
+
+
+def _parse_list(value: Optional[str]) -> FrozenSet[str]:
+    if value is None:
+        return frozenset()
+    return frozenset(field.strip() for field in value.split(",") if field.strip())
+
+
+@dataclass(frozen=True)
+class ICAPServiceOptions:
+    """Capabilities of an ICAP service as given in an OPTIONS response"""
+
+    methods: FrozenSet[str]
+    preview: Optional[int]
+    allow_204: bool
+    max_connections: Optional[int]
+    # Time in seconds for which the options are valid, or None if they do
+    # not expire
+    ttl: Optional[int]
+    istag: Optional[str]
+    service: Optional[str]
+
+    @classmethod
+    def from_response(cls, response: ICAPResponse) -> "ICAPServiceOptions":
+        return cls(
+            methods=_parse_list(response.get_header("Methods")),
+            preview=_parse_int(response.get_header("Preview")),
+            allow_204="204" in _parse_list(response.get_header("Allow")),
+            max_connections=_parse_int(response.get_header("Max-Connections")),
+            ttl=_parse_int(response.get_header("Options-TTL")),
+            istag=response.get_header("ISTag"),
+            service=response.get_header("Service"),
+        )
+
+
+@dataclass
+class _CacheEntry:
+    # None if fetching the options failed
+    options: Optional[ICAPServiceOptions]
+    refresh_at: Optional[float]
+    expires_at: Optional[float]
+    # Number of consecutive failures to fetch the options
+    failures: int = 0
+
+
+class ICAPOptionsCache:
+    """Cache of OPTIONS responses by host, port and service path.
+
+    Cached options expire after their Options-TTL. Options are refreshed with
+    `refresh_in_background` once most of the TTL has passed, so that requests
+    do not need to wait for OPTIONS requests. Failures to fetch options are
+    cached too, and the options are fetched again after a backoff that grows
+    with each consecutive failure.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[ServiceKey, _CacheEntry] = {}
+        self._refreshes: Dict[ServiceKey, "asyncio.Task[None]"] = {}
+
+    def get(self, key: ServiceKey) -> Optional[ICAPServiceOptions]:
+        """Return options that have not expired"""
+        entry = self._entries.get(key)
+        if entry is None or self._expired(entry, time.monotonic()):
+            return None
+        return entry.options
+
+    def needs_fetch(self, key: ServiceKey) -> bool:
+        """Whether neither options nor a recent failure is cached"""
+        entry = self._entries.get(key)
+        return entry is None or self._expired(entry, time.monotonic())
+
+    def _expired(self, entry: _CacheEntry, now: float) -> bool:
+        return entry.expires_at is not None and now >= entry.expires_at
+
+    def put(self, key: ServiceKey, response: ICAPResponse) -> ICAPServiceOptions:
+        options = ICAPServiceOptions.from_response(response)
+        now = time.monotonic()
+        self._entries[key] = _CacheEntry(
+            options,
+            now + REFRESH_RATIO * options.ttl if options.ttl is not None else None,
+            now + options.ttl if options.ttl is not None else None,
+        )
+        return options
+
+    def put_failure(self, key: ServiceKey) -> None:
+        """Record that fetching the options of a service failed.
+
+        Options that have not expired yet are kept until they expire, and only
+        their refresh is postponed.
+        """
+        entry = self._entries.get(key)
+        failures = entry.failures + 1 if entry is not None else 1
+        now = time.monotonic()
+        retry_at = now + min(FAILURE_BACKOFF * 2 ** (failures - 1), MAX_FAILURE_BACKOFF)
+        if (
+            entry is not None
+            and entry.options is not None
+            and not self._expired(entry, now)
+        ):
+            entry.refresh_at = retry_at
+            entry.failures = failures
+        else:
+            self._entries[key] = _CacheEntry(None, retry_at, retry_at, failures)
+
+    def max_connections(self, host: str, port: int) -> Optional[int]:
+        """Return the smallest Max-Connections of the services of a server"""
+        limits = [
+            entry.options.max_connections
+            for (entry_host, entry_port, _), entry in self._entries.items()
+            if entry_host == host
+            and entry_port == port
+            and entry.options is not None
+            and entry.options.max_connections is not None
+        ]
+        return min(limits) if limits else None
+
+    def due_for_refresh(self, host: str, port: int) -> List[ServiceKey]:
+        """Return the services of a server whose options should be refreshed"""
+        now = time.monotonic()
+        return [
+            key
+            for key, entry in self._entries.items()
+            if key[0] == host
+            and key[1] == port
+            and entry.refresh_at is not None
+            and now >= entry.refresh_at
+            and key not in self._refreshes
+        ]
+
+    def refresh_in_background(
+        self,
+        key: ServiceKey,
+        fetch: Callable[[], Awaitable[ICAPResponse]],
+    ) -> None:
+        """Fetch the options of a service unless they are already being
+        fetched.
+
+        `fetch` sends an OPTIONS request through a connection using this
+        cache, which caches the response.
+        """
+        if key not in self._refreshes:
+            self._refreshes[key] = asyncio.create_task(self._refresh(key, fetch))
+
+    async def _refresh(
+        self,
+        key: ServiceKey,
+        fetch: Callable[[], Awaitable[ICAPResponse]],
+    ) -> None:
+        try:
+            await fetch()
+        except Exception:
+            self.put_failure(key)
+        finally:
+            del self._refreshes[key]
+
+    async def close(self) -> None:
+        """Cancel refreshes that are in progress"""
+        refreshes = list(self._refreshes.values())
+        for refresh in refreshes:
+            refresh.cancel()
+        await asyncio.gather(*refreshes, return_exceptions=True)
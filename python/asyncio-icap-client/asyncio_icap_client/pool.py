@@ -0,0 +1,462 @@
+import asyncio
+import contextlib
+import functools
+from collections import deque
+from dataclasses import dataclass
+from types import TracebackType
+from typing import AsyncIterator, Deque, Dict, List, Optional, Sequence, Type
+
+from ._encoder import DEFAULT_MAX_CHUNK_SIZE
+from .async_readable import AsyncReadable
+from .client import DEFAULT_ICAP_PORT
+from .connection import ICAPConnection
+from .errors import ICAPPoolClosedError, ICAPProtocolError, StaleConnectionError
+from .options import ICAPOptionsCache
+from .request import ICAPRequest, RequestBody, RequestMethod
+from .response import ICAPResponse, ICAPResponseStream
+
+DEFAULT_MAX_SIZE = 10
+DEFAULT_IDLE_TIMEOUT = 60.0
+DEFAULT_HEALTH_CHECK_INTERVAL = 30.0
+# Interval in seconds between checks for expired idle connections
+MAINTENANCE_INTERVAL = 1.0
+
+
+@dataclass
+class _IdleConnection:
+    connection: ICAPConnection
+    idle_since: float
+
+
+class ICAPConnectionPool:
+    """Pool of ICAP connections shared by concurrent requests.
+
+    Connections are opened on demand up to `max_size` and returned to the pool
+    after each request. Requests waiting for a connection are served in the
+    order they arrived. Connections are closed when the server asks for it
+    with `Connection: close`, when a request fails and after they have been
+    idle for `idle_timeout` seconds, while at least `min_size` connections are
+    kept open. Connections idle for longer than `health_check_interval`
+    seconds are checked with an `OPTIONS` request for `health_check_path`
+    before they are used again.
+
+    A request that fails because the server had closed the connection while
+    it was idle is sent again once on a new connection, unless its body is
+    read from a file and can therefore not be sent again.
+
+    OPTIONS responses are cached in `options_cache`. The pool does not open
+    more connections than the smallest Max-Connections of the cached
+    services. Options of `services` are fetched when the pool is started, and
+    cached options are refreshed in the background before they expire.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = DEFAULT_ICAP_PORT,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        max_chunk_size: int = DEFAULT_MAX_CHUNK_SIZE,
+        preview: bool = False,
+        allow_204: bool = False,
+        options_cache: Optional[ICAPOptionsCache] = None,
+        services: Sequence[str] = (),
+        min_size: int = 0,
+        max_size: int = DEFAULT_MAX_SIZE,
+        idle_timeout: Optional[float] = DEFAULT_IDLE_TIMEOUT,
+        health_check_path: Optional[str] = None,
+        health_check_interval: Optional[float] = DEFAULT_HEALTH_CHECK_INTERVAL,
+        request_timeout: Optional[float] = None,
+    ):
+        if max_size < 1:
+            raise ValueError("Maximum pool size must be at least one.")
+        if not 0 <= min_size <= max_size:
+            raise ValueError("Minimum pool size must be between 0 and max_size.")
+        self.host = host
+        self.port = port
+        self.headers = headers
+        self.max_chunk_size = max_chunk_size
+        self.preview = preview
+        self.allow_204 = allow_204
+        self.services = services
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_path = health_check_path
+        self.health_check_interval = health_check_interval
+        self.request_timeout = request_timeout
+        # Most recently used connections are at the end.
+        self._idle: Deque[_IdleConnection] = deque()
+        self._waiters: Deque["asyncio.Future[Optional[_IdleConnection]]"] = deque()
+        # Number of connections open or being opened
+        self._size = 0
+        self._closed = False
+        self._maintenance_task: Optional["asyncio.Task[None]"] = None
+        # The cache is shared by the connections of the pool.
+        self._owns_options_cache = options_cache is None
+        self.options_cache = (
+            options_cache if options_cache is not None else ICAPOptionsCache()
+        )
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @property
+    def limit(self) -> int:
+        """Maximum number of connections, as limited by the server"""
+        max_connections = self.options_cache.max_connections(self.host, self.port)
+        if max_connections is None:
+            return self.max_size
+        return max(1, min(self.max_size, max_connections))
+
+    async def start(self) -> None:
+        """Open `min_size` connections, fetch the options of `services` and
+        start maintaining the pool in the background"""
+        if self._closed:
+            raise ICAPPoolClosedError()
+        results = await asyncio.gather(
+            *(self.options(service) for service in self.services),
+            return_exceptions=True,
+        )
+        for service, result in zip(self.services, results):
+            if isinstance(result, Exception):
+                # The options are fetched again in the background, so the pool
+                # can be started before the server is reachable.
+                self.options_cache.put_failure((self.host, self.port, service))
+            elif isinstance(result, BaseException):
+                raise result
+        await self._fill()
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self._maintain())
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._maintenance_task
+            self._maintenance_task = None
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(ICAPPoolClosedError())
+        idle = list(self._idle)
+        self._idle.clear()
+        self._size -= len(idle)
+        await asyncio.gather(
+            *(self._close_connection(item.connection) for item in idle)
+        )
+        if self._owns_options_cache:
+            await self.options_cache.close()
+
+    async def acquire(self, fresh: bool = False) -> ICAPConnection:
+        """Take a connection from the pool, waiting for one if necessary.
+
+        A new connection is opened instead of using an idle one if `fresh` is
+        true.
+        """
+        while True:
+            idle = await self._reserve()
+            if idle is not None and fresh:
+                # The idle connection is closed to make room for a new one.
+                try:
+                    await self._close_connection(idle.connection)
+                except BaseException:
+                    self._release_slot()
+                    raise
+                idle = None
+            if idle is None:
+                try:
+                    return await self._connect()
+                except BaseException:
+                    self._release_slot()
+                    raise
+            try:
+                healthy = await self._check(idle)
+            except BaseException:
+                await self._discard(idle.connection)
+                raise
+            if healthy:
+                return idle.connection
+            await self._discard(idle.connection)
+
+    async def release(self, connection: ICAPConnection) -> None:
+        """Return a connection acquired with `acquire` to the pool"""
+        if self._closed or not connection.is_reusable:
+            await self._discard(connection)
+            return
+        idle = _IdleConnection(connection, asyncio.get_running_loop().time())
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(idle)
+                return
+        self._idle.append(idle)
+
+    @contextlib.asynccontextmanager
+    async def connection(self, fresh: bool = False) -> AsyncIterator[ICAPConnection]:
+        connection = await self.acquire(fresh)
+        try:
+            yield connection
+        finally:
+            await self.release(connection)
+
+    async def request(
+        self,
+        request: ICAPRequest,
+        timeout: Optional[float] = None,
+    ) -> ICAPResponse:
+        """Send a request on a connection of the pool.
+
+        The timeout covers both waiting for a connection and the request,
+        and defaults to `request_timeout`. Connections of requests that time
+        out or are cancelled are closed instead of being reused, as they may
+        have been left in the middle of a request or response.
+        """
+        if timeout is None:
+            timeout = self.request_timeout
+        if timeout is None:
+            return await self._request(request)
+        return await asyncio.wait_for(self._request(request), timeout)
+
+    async def _request(self, request: ICAPRequest) -> ICAPResponse:
+        try:
+            async with self.connection() as connection:
+                return await connection.request(request)
+        except StaleConnectionError:
+            if not _can_resend(request):
+                raise
+        async with self.connection(fresh=True) as connection:
+            return await connection.request(request)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, request: ICAPRequest) -> AsyncIterator[ICAPResponseStream]:
+        async with contextlib.AsyncExitStack() as stack:
+            try:
+                connection = await stack.enter_async_context(self.connection())
+                response = await stack.enter_async_context(connection.stream(request))
+            except StaleConnectionError:
+                if not _can_resend(request):
+                    raise
+                # The stale connection is discarded before opening a new one.
+                await stack.aclose()
+                connection = await stack.enter_async_context(
+                    self.connection(fresh=True)
+                )
+                response = await stack.enter_async_context(connection.stream(request))
+            yield response
+
+    async def reqmod(
+        self,
+        path: Optional[str] = None,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        encapsulated_request_headers: Optional[bytes] = None,
+        encapsulated_request_body: RequestBody = None,
+        timeout: Optional[float] = None,
+    ) -> ICAPResponse:
+        request = ICAPRequest(
+            method=RequestMethod.REQMOD,
+            path=path,
+            params=params if params is not None else {},
+            headers=headers if headers is not None else {},
+            encapsulated_request_headers=encapsulated_request_headers,
+            encapsulated_request_body=encapsulated_request_body,
+        )
+        return await self.request(request, timeout)
+
+    async def respmod(
+        self,
+        path: Optional[str] = None,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        encapsulated_request_headers: Optional[bytes] = None,
+        encapsulated_response_headers: Optional[bytes] = None,
+        encapsulated_response_body: RequestBody = None,
+        timeout: Optional[float] = None,
+    ) -> ICAPResponse:
+        request = ICAPRequest(
+            method=RequestMethod.RESPMOD,
+            path=path,
+            params=params if params is not None else {},
+            headers=headers if headers is not None else {},
+            encapsulated_request_headers=encapsulated_request_headers,
+            encapsulated_response_headers=encapsulated_response_headers,
+            encapsulated_response_body=encapsulated_response_body,
+        )
+        return await self.request(request, timeout)
+
+    async def options(
+        self,
+        path: Optional[str] = None,
+        params: Optional[Dict[str, str]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        options_body: RequestBody = None,
+        timeout: Optional[float] = None,
+    ) -> ICAPResponse:
+        request = ICAPRequest(
+            method=RequestMethod.OPTIONS,
+            path=path,
+            params=params if params is not None else {},
+            headers=headers if headers is not None else {},
+            options_body=options_body,
+        )
+        return await self.request(request, timeout)
+
+    async def _reserve(self) -> Optional[_IdleConnection]:
+        """Take an idle connection or reserve a slot for a new connection.
+
+        Returns None when a slot for a new connection was reserved.
+        """
+        if self._closed:
+            raise ICAPPoolClosedError()
+        # Requests arriving while others are waiting queue up behind them.
+        if not self._waiters:
+            if self._idle:
+                return self._idle.pop()
+            if self._size < self.limit:
+                self._size += 1
+                return None
+        waiter: "asyncio.Future[Optional[_IdleConnection]]"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            # The waiter may have been handed a connection or a slot just
+            # before the cancellation.
+            if waiter.done() and not waiter.cancelled():
+                if waiter.exception() is None:
+                    idle = waiter.result()
+                    if idle is None:
+                        self._release_slot()
+                    else:
+                        await self.release(idle.connection)
+            raise
+
+    def _release_slot(self) -> None:
+        """Hand a free slot to the first waiter or give it back to the pool"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._size -= 1
+
+    async def _connect(self) -> ICAPConnection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return ICAPConnection(
+            self.host,
+            self.port,
+            reader,
+            writer,
+            headers=self.headers,
+            max_chunk_size=self.max_chunk_size,
+            preview=self.preview,
+            allow_204=self.allow_204,
+            options_cache=self.options_cache,
+            # Options are fetched on any connection of the pool.
+            fetch_options=self.options,
+        )
+
+    async def _check(self, idle: _IdleConnection) -> bool:
+        connection = idle.connection
+        if not connection.is_reusable:
+            return False
+        if self.health_check_path is None or self.health_check_interval is None:
+            return True
+        idle_time = asyncio.get_running_loop().time() - idle.idle_since
+        if idle_time < self.health_check_interval:
+            return True
+        try:
+            response = await connection.options(self.health_check_path)
+        except (OSError, ICAPProtocolError):
+            return False
+        return response.status == 200 and connection.is_reusable
+
+    async def _discard(self, connection: ICAPConnection) -> None:
+        self._release_slot()
+        await self._close_connection(connection)
+
+    async def _close_connection(self, connection: ICAPConnection) -> None:
+        with contextlib.suppress(OSError):
+            await connection.close()
+
+    async def _fill(self) -> None:
+        """Open connections until the pool has at least `min_size` of them"""
+        while self._size < min(self.min_size, self.limit) and not self._closed:
+            self._size += 1
+            try:
+                connection = await self._connect()
+            except BaseException:
+                self._release_slot()
+                raise
+            await self.release(connection)
+
+    def _expire_idle(self) -> List[ICAPConnection]:
+        if self.idle_timeout is None:
+            return []
+        expired = []
+        deadline = asyncio.get_running_loop().time() - self.idle_timeout
+        # Idle connections are ordered from the least recently used.
+        while (
+            self._idle
+            and self._idle[0].idle_since <= deadline
+            and self._size > self.min_size
+        ):
+            expired.append(self._idle.popleft().connection)
+            self._size -= 1
+        return expired
+
+    async def _maintain(self) -> None:
+        while True:
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+            expired = self._expire_idle()
+            await asyncio.gather(
+                *(self._close_connection(connection) for connection in expired)
+            )
+            self._refresh_options()
+            try:
+                await self._fill()
+            except OSError:
+                # The server is unreachable; try again later.
+                pass
+
+    def _refresh_options(self) -> None:
+        for key in self.options_cache.due_for_refresh(self.host, self.port):
+            self.options_cache.refresh_in_background(
+                key, functools.partial(self.options, key[2])
+            )
+
+    async def __aenter__(self) -> "ICAPConnectionPool":
+        await self.start()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.close()
+
+
+def _can_resend(request: ICAPRequest) -> bool:
+    """Whether a request can be sent again after a stale connection failed.
+
+    ICAP requests have no side effects on the server, but bodies read from
+    files cannot be read again.
+    """
+    return not any(
+        isinstance(body, AsyncReadable)
+        for body in (
+            request.encapsulated_request_body,
+            request.encapsulated_response_body,
+            request.options_body,
+        )
+    )
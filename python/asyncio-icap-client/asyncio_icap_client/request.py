@@ -28,6 +28,10 @@ class ICAPRequest:
     encapsulated_response_body: RequestBody = None
     options_body: RequestBody = None
 
+    # Number of bytes of the encapsulated body sent before the server decides
+    # whether it needs the rest
+    preview: Optional[int] = None
+
     def __post_init__(self) -> None:
         bodies = sum(
             (
@@ -40,3 +44,5 @@ class ICAPRequest:
             raise ValueError(
                 "ICAP requests can contain at most one body.",
             )
+        if self.preview is not None and self.preview < 0:
+            raise ValueError("Preview size must not be negative.")
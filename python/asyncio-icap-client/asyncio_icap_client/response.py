@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Optional
 
 ResponseBody = Optional[bytes]
 
@@ -16,3 +16,47 @@ class ICAPResponse:
     encapsulated_request_body: ResponseBody = None
     encapsulated_response_body: ResponseBody = None
     options_body: ResponseBody = None
+
+    def get_header(self, name: str) -> Optional[str]:
+        """Look up a header by its case-insensitive name"""
+        for header_name, header_value in self.headers.items():
+            if header_name.lower() == name.lower():
+                return header_value
+        return None
+
+
+class ICAPResponseStream:
+    """ICAP response whose encapsulated body is received as it is read.
+
+    The status, headers and encapsulated HTTP headers are available as soon
+    as they have been received. The encapsulated body, if any, is read by
+    iterating over the stream, which yields the body in parts.
+    """
+
+    def __init__(self, head: ICAPResponse, body: Optional[AsyncIterator[bytes]]):
+        self.status = head.status
+        self.reason = head.reason
+        self.headers = head.headers
+        self.encapsulated_request_headers = head.encapsulated_request_headers
+        self.encapsulated_response_headers = head.encapsulated_response_headers
+        self._body = body
+        self._complete = body is None
+
+    @property
+    def complete(self) -> bool:
+        """Whether the whole body has been read"""
+        return self._complete
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[bytes]:
+        if self._body is None:
+            return
+        async for data in self._body:
+            yield data
+        self._complete = True
+
+    async def read(self) -> bytes:
+        """Read the rest of the body"""
+        return b"".join([data async for data in self])
@@ -0,0 +1,87 @@
+"""Compare the throughput of concurrent requests sharing one connection and
+a connection pool.
+
+A local server answering each request after a fixed delay is used, so that
+the results show how throughput scales with the number of concurrent
+requests.
+
+Usage: python benchmarks/concurrent_requests.py [DELAY_MS]
+"""
+import asyncio
+import sys
+import time
+from asyncio.base_events import Server
+from typing import Awaitable, Callable
+
+from asyncio_icap_client import ICAPClient, ICAPConnectionPool, ICAPResponse
+
+HOST = "127.0.0.1"
+CONCURRENCY = [1, 4, 16, 64]
+REQUESTS_PER_CALLER = 20
+RESPONSE = (
+    b"ICAP/1.0 204 No Content\r\n"
+    b"X-FSecure-Scan-Result: clean\r\n"
+    b"Encapsulated: null-body=0\r\n"
+    b"\r\n"
+)
+
+
+async def serve(delay: float) -> Server:
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                # Requests without bodies end with an empty line.
+                await reader.readuntil(b"\r\n\r\n")
+                await asyncio.sleep(delay)
+                writer.write(RESPONSE)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, HOST, 0)
+
+
+async def run(
+    send: Callable[[], Awaitable[ICAPResponse]],
+    concurrency: int,
+) -> float:
+    async def caller() -> None:
+        for _ in range(REQUESTS_PER_CALLER):
+            response = await send()
+            assert response.status == 204
+
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return concurrency * REQUESTS_PER_CALLER / (time.perf_counter() - start)
+
+
+async def main() -> None:
+    delay = (float(sys.argv[1]) if len(sys.argv) > 1 else 5.0) / 1000
+    server = await serve(delay)
+    port = server.sockets[0].getsockname()[1]
+    headers = {"X-Meta-SHA1": "0" * 40}
+    print(f"Server delay: {delay * 1000:.1f} ms")
+    for concurrency in CONCURRENCY:
+        async with ICAPClient(HOST, port) as connection:
+            shared = await run(
+                lambda: connection.respmod("/respmod", headers=headers),
+                concurrency,
+            )
+        async with ICAPConnectionPool(HOST, port, max_size=concurrency) as pool:
+            pooled = await run(
+                lambda: pool.respmod("/respmod", headers=headers),
+                concurrency,
+            )
+        print(
+            f"{concurrency:>3} concurrent: shared connection {shared:8.1f} req/s, "
+            f"pool {pooled:8.1f} req/s"
+        )
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""Measure the speed of decoding large chunked responses fed in small reads.
+
+Usage: python benchmarks/decode_response.py [READ_SIZE]
+"""
+import sys
+import time
+from typing import Iterator, List
+
+from asyncio_icap_client._decoder import ICAPResponseDecoder, Incomplete
+
+HTTP_HEADERS = b"HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n\r\n"
+CHUNK_SIZES = [4096, 65536, 1 << 20]
+BODY_SIZES = [1 << 20, 8 << 20, 32 << 20]
+REPEAT = 3
+
+
+def make_response(body_size: int, chunk_size: int) -> bytes:
+    chunk = b"%x\r\n%b\r\n" % (chunk_size, b"x" * chunk_size)
+    chunks = b"".join(chunk for _ in range(body_size // chunk_size))
+    return (
+        b"ICAP/1.0 200 OK\r\n"
+        b"ISTag: benchmark\r\n"
+        b"Encapsulated: res-hdr=0, res-body=%d\r\n"
+        b"\r\n"
+        b"%b%b0\r\n\r\n" % (len(HTTP_HEADERS), HTTP_HEADERS, chunks)
+    )
+
+
+def reads(data: bytes, read_size: int) -> Iterator[bytes]:
+    view = memoryview(data)
+    for offset in range(0, len(data), read_size):
+        yield bytes(view[offset : offset + read_size])
+
+
+def decode(pieces: List[bytes], body_size: int) -> float:
+    decoder = ICAPResponseDecoder()
+    start = time.perf_counter()
+    for piece in pieces:
+        decoder.feed(piece)
+        response = decoder.decode_response()
+    seconds = time.perf_counter() - start
+    assert not isinstance(response, Incomplete)
+    assert response.encapsulated_response_body is not None
+    assert len(response.encapsulated_response_body) == body_size
+    return seconds
+
+
+def main() -> None:
+    read_size = int(sys.argv[1]) if len(sys.argv) > 1 else 4096
+    print(f"Read size: {read_size} bytes")
+    for chunk_size in CHUNK_SIZES:
+        for body_size in BODY_SIZES:
+            data = make_response(body_size, chunk_size)
+            pieces = list(reads(data, read_size))
+            seconds = min(decode(pieces, body_size) for _ in range(REPEAT))
+            print(
+                f"chunk {chunk_size:>6} body {body_size >> 20:>3} MiB: "
+                f"{seconds * 1e3:8.1f} ms, {body_size / seconds / 1e6:8.1f} MB/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
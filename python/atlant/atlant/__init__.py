@@ -3,9 +3,20 @@ from .auth import (
     OAuthClientCredentialsAuthenticator,
     OAuthClientCredentialsClient,
 )
+from .cache import (
+    CachingScanClient,
+    DefinitionUpdateTracker,
+    MemoryVerdictStore,
+    SQLiteVerdictStore,
+    VerdictStore,
+)
 from .common import APIException
 from .config import ConfigClient
+from .multipart import FileChangedError
+from .pipeline import FileScanResult, ScanPipeline, scan_hashes, shared_client_factory
+from .poll import PollScheduler
 from .scan import (
+    ContentHashMismatchError,
     Detection,
     DetectionCategory,
     ScanClient,
@@ -17,12 +28,17 @@ from .scan import (
     ScanStatus,
     SecurityCloudSettings,
 )
+from .session import configure_session
+from .state import ScanStateIndex
+from .stats import StatsClient
 
 __all__ = [
     "OAuthClientCredentialsAuthenticator",
     "OAuthClientCredentialsClient",
     "APIKeyAuthenticator",
     "APIException",
+    "FileChangedError",
+    "ContentHashMismatchError",
     "ConfigClient",
     "ScanClient",
     "ScanStatus",
@@ -34,4 +50,17 @@ __all__ = [
     "ScanSettings",
     "ScanContentMetadata",
     "ScanMetadata",
+    "StatsClient",
+    "PollScheduler",
+    "ScanPipeline",
+    "FileScanResult",
+    "shared_client_factory",
+    "scan_hashes",
+    "ScanStateIndex",
+    "CachingScanClient",
+    "VerdictStore",
+    "MemoryVerdictStore",
+    "SQLiteVerdictStore",
+    "DefinitionUpdateTracker",
+    "configure_session",
 ]
@@ -0,0 +1,245 @@
+import asyncio
+import logging
+import time
+import urllib.parse
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional
+
+import aiohttp
+from requests.exceptions import UnrewindableBodyError
+
+from .auth import (
+    DEFAULT_REFRESH_MARGIN,
+    DEFAULT_SCOPES,
+    LOCALLY_MANAGED_CLIENT_AUDIENCE,
+    OAuthAccessToken,
+    OAuthErrorResponse,
+    Scope,
+)
+from .common import APIException
+from .serialization import loads
+
+
+@dataclass
+class AsyncRequest:
+    method: str
+    url: str
+    headers: Dict[str, str] = field(default_factory=dict)
+    data: Any = None
+    # Function returning the data to send if the request is sent again, for
+    # data that cannot be sent more than once
+    rewind: Optional[Callable[[], Any]] = None
+
+    def rewind_data(self) -> None:
+        """Prepare the data to be sent again"""
+        if self.rewind is not None:
+            self.data = self.rewind()
+        elif self.data is not None and not isinstance(self.data, (bytes, str, dict)):
+            raise UnrewindableBodyError("Unable to rewind request body")
+
+
+@dataclass
+class AsyncResponse:
+    status_code: int
+    headers: Mapping[str, str]
+    content: bytes
+
+    def json(self) -> Any:
+        return loads(self.content)
+
+
+async def send_request(
+    session: aiohttp.ClientSession,
+    request: AsyncRequest,
+) -> AsyncResponse:
+    async with session.request(
+        request.method,
+        request.url,
+        headers=request.headers,
+        data=request.data,
+    ) as response:
+        content = await response.read()
+        return AsyncResponse(response.status, response.headers, content)
+
+
+class AsyncOAuthClientCredentialsClient:
+    def __init__(self, session: aiohttp.ClientSession, service_url: str) -> None:
+        self.session = session
+        self.service_url = service_url
+
+    async def get_access_token(
+        self,
+        client_id: str,
+        client_secret: str,
+        audience: str = LOCALLY_MANAGED_CLIENT_AUDIENCE,
+        scopes: Iterable[Scope] = DEFAULT_SCOPES,
+    ) -> OAuthAccessToken:
+        logging.debug("Getting access token.")
+        request = AsyncRequest(
+            "POST",
+            self.token_url,
+            data={
+                "grant_type": "client_credentials",
+                "client_id": client_id,
+                "client_secret": client_secret,
+                "audience": audience,
+                "scope": " ".join(scope.value for scope in scopes),
+            },
+        )
+        response = await send_request(self.session, request)
+        data = response.json()
+        if response.status_code == 200:
+            return OAuthAccessToken(**data)
+        raise OAuthErrorResponse(**data).to_exception()
+
+    @cached_property
+    def token_url(self) -> str:
+        return urllib.parse.urljoin(self.service_url, "api/token/v1")
+
+
+class AsyncAuthenticatorBase(ABC):
+    @abstractmethod
+    async def perform_request(
+        self,
+        session: aiohttp.ClientSession,
+        request: AsyncRequest,
+    ) -> AsyncResponse:
+        """Perform authenticated request"""
+
+    async def perform_upload(
+        self,
+        session: aiohttp.ClientSession,
+        request: AsyncRequest,
+        check_request: AsyncRequest,
+    ) -> AsyncResponse:
+        """Perform authenticated request whose body should only be sent once.
+
+        See `AuthenticatorBase.perform_upload`.
+        """
+        return await self.perform_request(session, request)
+
+
+class AsyncOAuthClientCredentialsAuthenticator(AsyncAuthenticatorBase):
+    def __init__(
+        self,
+        # Session to use for making authentication requests
+        session: aiohttp.ClientSession,
+        # Authentication service URL
+        service_url: str,
+        # Client ID
+        client_id: str,
+        # Client secret
+        client_secret: str,
+        # Client audience
+        audience: str = LOCALLY_MANAGED_CLIENT_AUDIENCE,
+        # Scopes for access tokens
+        scopes: Iterable[Scope] = DEFAULT_SCOPES,
+        # Time in seconds before expiry at which tokens are refreshed
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+    ):
+        self.client = AsyncOAuthClientCredentialsClient(session, service_url)
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.audience = audience
+        self.scopes = frozenset(scopes)
+        self.refresh_margin = refresh_margin
+        self.token: Optional[OAuthAccessToken] = None
+        self._refresh_at = 0.0
+        # Latest token that the server has accepted
+        self._accepted_token: Optional[OAuthAccessToken] = None
+        # Concurrent requests share a single token fetch instead of each
+        # fetching their own.
+        self._token_lock = asyncio.Lock()
+
+    async def perform_request(
+        self,
+        session: aiohttp.ClientSession,
+        request: AsyncRequest,
+    ) -> AsyncResponse:
+        token = await self._get_token(None)
+        response = await self._send_request(session, request, token)
+        if response.status_code != 401:
+            self._accepted_token = token
+            return response
+        logging.debug("Received unauthorized response, refreshing access token.")
+        token = await self._get_token(token)
+        request.rewind_data()
+        response = await self._send_request(session, request, token)
+        if response.status_code == 401:
+            raise APIException(
+                "Authentication failed",
+                "Performing authenticated request failed",
+            )
+        self._accepted_token = token
+        return response
+
+    async def perform_upload(
+        self,
+        session: aiohttp.ClientSession,
+        request: AsyncRequest,
+        check_request: AsyncRequest,
+    ) -> AsyncResponse:
+        if await self._get_token(None) is not self._accepted_token:
+            logging.debug("Checking access token before uploading.")
+            await self.perform_request(session, check_request)
+        return await self.perform_request(session, request)
+
+    async def _get_token(
+        self,
+        rejected: Optional[OAuthAccessToken],
+    ) -> OAuthAccessToken:
+        async with self._token_lock:
+            # Another request may have already replaced the rejected token
+            # while this one was waiting for the lock. Tokens are also
+            # replaced shortly before they expire.
+            if (
+                self.token is None
+                or self.token is rejected
+                or time.monotonic() >= self._refresh_at
+            ):
+                fetched_at = time.monotonic()
+                self.token = await self.client.get_access_token(
+                    self.client_id,
+                    self.client_secret,
+                    self.audience,
+                    self.scopes,
+                )
+                self._refresh_at = (
+                    fetched_at
+                    + self.token.expires_in
+                    - min(self.refresh_margin, self.token.expires_in / 2)
+                )
+            return self.token
+
+    async def _send_request(
+        self,
+        session: aiohttp.ClientSession,
+        request: AsyncRequest,
+        token: OAuthAccessToken,
+    ) -> AsyncResponse:
+        request.headers["Authorization"] = f"Bearer {token.access_token}"
+        return await send_request(session, request)
+
+
+class AsyncAPIKeyAuthenticator(AsyncAuthenticatorBase):
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+
+    async def perform_request(
+        self,
+        session: aiohttp.ClientSession,
+        request: AsyncRequest,
+    ) -> AsyncResponse:
+        request.headers["X-Api-Key"] = self.api_key
+        return await send_request(session, request)
+
+
+class AsyncDummyAuthenticator(AsyncAuthenticatorBase):
+    async def perform_request(
+        self,
+        session: aiohttp.ClientSession,
+        request: AsyncRequest,
+    ) -> AsyncResponse:
+        return await send_request(session, request)
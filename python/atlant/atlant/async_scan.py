@@ -0,0 +1,266 @@
+import asyncio
+import itertools
+import logging
+import urllib.parse
+from functools import cached_property
+from typing import (
+    Any,
+    AsyncIterator,
+    BinaryIO,
+    Callable,
+    Iterable,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import aiohttp
+import aiohttp.abc
+import aiohttp.payload
+from requests.exceptions import UnrewindableBodyError
+
+from .async_auth import AsyncAuthenticatorBase, AsyncRequest
+from .multipart import DEFAULT_CHUNK_SIZE, FileChangedError, remaining_length
+from .scan import (
+    HashLookupTemplate,
+    ScanMetadata,
+    ScanResponse,
+    ScanStatus,
+    parse_poll_response,
+    parse_scan_response,
+)
+
+# Default maximum number of hashes being scanned at the same time.
+DEFAULT_MAX_IN_FLIGHT = 64
+
+
+class _FilePayload(aiohttp.payload.Payload):
+    """File content read from a given position without closing the file.
+
+    aiohttp closes files it sends, so the content could not be sent again when
+    a request has to be retried. The file is read in a thread, in pieces of
+    `DEFAULT_CHUNK_SIZE` bytes, and exactly `length` bytes are sent if the
+    length is known.
+    """
+
+    _value: BinaryIO
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        position: Optional[int],
+        length: Optional[int],
+        **kwargs: Any,
+    ):
+        super().__init__(file, **kwargs)
+        self._position = position
+        self._size = length
+
+    async def write(self, writer: aiohttp.abc.AbstractStreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        if self._position is not None:
+            await loop.run_in_executor(None, self._value.seek, self._position)
+        remaining = self._size
+        while remaining is None or remaining > 0:
+            chunk_size = (
+                DEFAULT_CHUNK_SIZE
+                if remaining is None
+                else min(DEFAULT_CHUNK_SIZE, remaining)
+            )
+            data = await loop.run_in_executor(None, self._value.read, chunk_size)
+            if not data:
+                if remaining is not None:
+                    raise FileChangedError(
+                        f"File ended {remaining} bytes before its expected length"
+                    )
+                return
+            await writer.write(data)
+            if remaining is not None:
+                remaining -= len(data)
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        raise TypeError("File content cannot be decoded")
+
+
+def _tell(file: BinaryIO) -> Optional[int]:
+    try:
+        return file.tell() if file.seekable() else None
+    except (OSError, ValueError):
+        return None
+
+
+def make_form_data(
+    metadata: ScanMetadata,
+    file: Optional[BinaryIO] = None,
+    position: Optional[int] = None,
+    length: Optional[int] = None,
+) -> aiohttp.MultipartWriter:
+    writer = aiohttp.MultipartWriter("form-data")
+    part = writer.append(metadata.encode(), {"Content-Type": "application/json"})
+    part.set_content_disposition("form-data", name="metadata")
+    if file is not None:
+        part = writer.append_payload(
+            _FilePayload(
+                file,
+                position,
+                length,
+                content_type="application/octet-stream",
+            )
+        )
+        part.set_content_disposition("form-data", name="data")
+    return writer
+
+
+def _make_rewind(
+    metadata: ScanMetadata,
+    file: BinaryIO,
+    position: Optional[int],
+    length: Optional[int],
+) -> Callable[[], aiohttp.MultipartWriter]:
+    def rewind() -> aiohttp.MultipartWriter:
+        if position is None:
+            raise UnrewindableBodyError("Unable to rewind scanned content")
+        # The content is read again from its initial position.
+        return make_form_data(metadata, file, position, length)
+
+    return rewind
+
+
+class AsyncScanClient:
+    """Scanning client for asyncio applications.
+
+    All requests are made through the given session, so a single client (or
+    several clients sharing a session) can keep any number of scans in flight
+    while reusing the session's connection pool.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        service_url: str,
+        authenticator: AsyncAuthenticatorBase,
+    ):
+        self.session = session
+        self.service_url = service_url
+        self.authenticator = authenticator
+
+    @cached_property
+    def scan_url(self) -> str:
+        return urllib.parse.urljoin(self.service_url, "api/scan/v1")
+
+    @cached_property
+    def status_url(self) -> str:
+        return urllib.parse.urljoin(self.service_url, "api/status/v1")
+
+    async def scan(
+        self,
+        metadata: ScanMetadata,
+        file: Optional[BinaryIO] = None,
+    ) -> ScanResponse:
+        """Perform a scan"""
+        position = _tell(file) if file is not None else None
+        length = remaining_length(file) if file is not None else None
+        request = AsyncRequest(
+            "POST",
+            self.scan_url,
+            data=make_form_data(metadata, file, position, length),
+        )
+        if file is not None:
+            request.rewind = _make_rewind(metadata, file, position, length)
+            # Checking the credentials first avoids uploading the content
+            # again if the credentials are rejected.
+            response = await self.authenticator.perform_upload(
+                self.session,
+                request,
+                AsyncRequest("GET", self.status_url),
+            )
+        else:
+            response = await self.authenticator.perform_request(self.session, request)
+        return parse_scan_response(
+            response.status_code, response.headers, response.json
+        )
+
+    @cached_property
+    def hash_lookup_template(self) -> HashLookupTemplate:
+        return HashLookupTemplate()
+
+    async def scan_hash(self, sha1: str) -> ScanResponse:
+        """Perform a scan identifying the content by its SHA-1 hash only.
+
+        See `ScanClient.scan_hash`.
+        """
+        template = self.hash_lookup_template
+        request = AsyncRequest(
+            "POST",
+            self.scan_url,
+            headers={"Content-Type": template.content_type},
+            data=template.body(sha1),
+        )
+        response = await self.authenticator.perform_request(self.session, request)
+        return parse_scan_response(
+            response.status_code, response.headers, response.json
+        )
+
+    def url_for_poll_path(self, poll_path: str) -> str:
+        return urllib.parse.urljoin(self.service_url, poll_path)
+
+    async def poll(self, poll_path: str) -> ScanResponse:
+        """Poll a pending scan task"""
+        request = AsyncRequest("GET", self.url_for_poll_path(poll_path))
+        response = await self.authenticator.perform_request(self.session, request)
+        return parse_poll_response(response.status_code, response.json)
+
+    async def scan_until_completion(
+        self,
+        metadata: ScanMetadata,
+        file: Optional[BinaryIO] = None,
+    ) -> ScanResponse:
+        """Perform a scan and poll until the scan is fully completed"""
+        return await self.wait_for_completion(await self.scan(metadata, file))
+
+    async def wait_for_completion(self, response: ScanResponse) -> ScanResponse:
+        """Poll a scan until it is fully completed"""
+        while response.status == ScanStatus.PENDING:
+            assert response.poll_settings is not None
+            logging.debug(
+                f"Scan was not fully completed, sleeping for {response.poll_settings.retry_after} seconds",
+            )
+            await asyncio.sleep(response.poll_settings.retry_after)
+            response = await self.poll(response.poll_settings.poll_path)
+        assert response.status == ScanStatus.COMPLETE
+        return response
+
+
+async def scan_hashes(
+    client: AsyncScanClient,
+    hashes: Iterable[str],
+    *,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+) -> AsyncIterator[Tuple[str, ScanResponse]]:
+    """Scan content by SHA-1 hashes, yielding hashes with their verdicts.
+
+    At most `max_in_flight` hashes are being scanned at any time, sharing the
+    keep-alive connections of the client's session. Results are yielded in the
+    order the scans complete, not in the order of `hashes`.
+    """
+
+    async def scan_hash(hash: str) -> Tuple[str, ScanResponse]:
+        return hash, await client.wait_for_completion(await client.scan_hash(hash))
+
+    pending_hashes = iter(hashes)
+    tasks: Set["asyncio.Task[Tuple[str, ScanResponse]]"] = set()
+    try:
+        while True:
+            for hash in itertools.islice(pending_hashes, max_in_flight - len(tasks)):
+                tasks.add(asyncio.ensure_future(scan_hash(hash)))
+            if not tasks:
+                break
+            finished_tasks, tasks = await asyncio.wait(
+                tasks,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for finished in finished_tasks:
+                yield finished.result()
+    finally:
+        for task in tasks:
+            task.cancel()
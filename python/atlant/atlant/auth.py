@@ -1,12 +1,18 @@
+import json
 import logging
+import os
+import threading
+import time
 import urllib.parse
 from abc import ABC, abstractmethod
 from enum import Enum
 from functools import cached_property
-from typing import Iterable, Optional
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
 
 import requests
-from pydantic import BaseModel
+from pydantic import BaseModel, parse_file_as
+from requests.exceptions import UnrewindableBodyError
 
 from .common import APIException
 
@@ -26,12 +32,25 @@ LOCALLY_MANAGED_CLIENT_AUDIENCE = "f-secure-atlant"
 # Console.
 POLICY_MANAGER_MANAGED_CLIENT_AUDIENCE = "policy-manager"
 
+# Default time in seconds before expiry at which access tokens are refreshed.
+DEFAULT_REFRESH_MARGIN = 60
+
+# Lock serializing updates to token cache files within the process.
+_token_cache_lock = threading.Lock()
+
 
 class OAuthAccessToken(BaseModel):
     access_token: str
     expires_in: int
 
 
+class _CachedAccessToken(BaseModel):
+    access_token: str
+    expires_in: int
+    # Time since the epoch at which the token expires
+    expires_at: float
+
+
 class OAuthErrorResponse(BaseModel):
     error: str
     error_description: str
@@ -73,6 +92,201 @@ class OAuthClientCredentialsClient:
         return urllib.parse.urljoin(self.service_url, "api/token/v1")
 
 
+class OAuthTokenManager:
+    """Keeps a valid access token available for concurrent requests.
+
+    Access tokens are refreshed `refresh_margin` seconds before they expire,
+    from a background timer if `background_refresh` is enabled, so requests do
+    not have to be rejected before a new token is fetched. Only one token is
+    fetched at a time; threads needing a token while it is being fetched wait
+    for the fetch to complete and then share the new token.
+
+    If `cache_path` is given, tokens are stored in that file (readable only by
+    the current user) and reused by later processes until they expire.
+    """
+
+    def __init__(
+        self,
+        # Client to use for fetching access tokens
+        client: OAuthClientCredentialsClient,
+        # Client ID
+        client_id: str,
+        # Client secret
+        client_secret: str,
+        # Client audience
+        audience: str = LOCALLY_MANAGED_CLIENT_AUDIENCE,
+        # Scopes for access tokens
+        scopes: Iterable[Scope] = DEFAULT_SCOPES,
+        # Time in seconds before expiry at which tokens are refreshed
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+        # Whether tokens are refreshed in the background before they expire
+        background_refresh: bool = True,
+        # Path of file in which tokens are persisted between processes
+        cache_path: Optional[Union[str, Path]] = None,
+    ):
+        self.client = client
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.audience = audience
+        self.scopes = frozenset(scopes)
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+        self.cache_path = (
+            Path(cache_path).expanduser() if cache_path is not None else None
+        )
+        self.token: Optional[OAuthAccessToken] = None
+        # Time since the epoch at which the current token expires
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._refresh_at = 0.0
+        self._used = False
+        self._closed = False
+        self._cache_loaded = False
+
+    def get_token(self, rejected: Optional[str] = None) -> str:
+        """Get a valid access token.
+
+        If `rejected` is given, it is the token with which a request was
+        rejected, and a new token is fetched unless the current token has
+        already been replaced.
+        """
+        with self._lock:
+            if not self._cache_loaded:
+                self._cache_loaded = True
+                self._load_cached_token()
+            if (
+                self.token is None
+                or self.token.access_token == rejected
+                or time.time() >= self._refresh_at
+            ):
+                self._fetch_token()
+            assert self.token is not None
+            self._used = True
+            return self.token.access_token
+
+    def _set_token(self, token: OAuthAccessToken, expires_at: float) -> None:
+        self.token = token
+        self.expires_at = expires_at
+        # Tokens with a lifetime shorter than the refresh margin are refreshed
+        # halfway through their lifetime instead.
+        self._refresh_at = expires_at - min(self.refresh_margin, token.expires_in / 2)
+        self._used = False
+        self._schedule_refresh()
+
+    def _fetch_token(self) -> None:
+        fetched_at = time.time()
+        token = self.client.get_access_token(
+            self.client_id,
+            self.client_secret,
+            self.audience,
+            self.scopes,
+        )
+        self._set_token(token, fetched_at + token.expires_in)
+        if self.cache_path is not None:
+            self._store_cached_token()
+
+    def _schedule_refresh(self) -> None:
+        if not self.background_refresh or self._closed:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(
+            max(0.0, self._refresh_at - time.time()), self._refresh
+        )
+        self._timer.name = "TokenRefresh"
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh(self) -> None:
+        with self._lock:
+            # Tokens that have not been used since they were fetched are left
+            # to expire, so idle clients do not keep fetching new tokens. The
+            # token may also have been replaced after this refresh was due.
+            if self._closed or not self._used or time.time() < self._refresh_at:
+                return
+            logging.debug("Refreshing access token before it expires.")
+            try:
+                self._fetch_token()
+            except Exception as err:
+                # The token is fetched again when it is next needed.
+                logging.warning(f"Refreshing access token failed: {err}")
+
+    @property
+    def _cache_key(self) -> str:
+        scopes = " ".join(sorted(scope.value for scope in self.scopes))
+        return f"{self.client.token_url} {self.client_id} {self.audience} {scopes}"
+
+    def _read_cache_file(self) -> Dict[str, _CachedAccessToken]:
+        assert self.cache_path is not None
+        try:
+            return parse_file_as(Dict[str, _CachedAccessToken], self.cache_path)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            logging.warning(f"Ignoring invalid token cache {self.cache_path}: {err}")
+            return {}
+
+    def _load_cached_token(self) -> None:
+        if self.cache_path is None:
+            return
+        cached = self._read_cache_file().get(self._cache_key)
+        if cached is None or cached.expires_at <= time.time():
+            return
+        logging.debug(f"Using cached access token from {self.cache_path}.")
+        self._set_token(
+            OAuthAccessToken(
+                access_token=cached.access_token,
+                expires_in=cached.expires_in,
+            ),
+            cached.expires_at,
+        )
+
+    def _store_cached_token(self) -> None:
+        assert self.cache_path is not None and self.token is not None
+        with _token_cache_lock:
+            now = time.time()
+            # Expired tokens are dropped so the file does not grow without
+            # bounds.
+            cache = {
+                key: cached
+                for key, cached in self._read_cache_file().items()
+                if cached.expires_at > now
+            }
+            cache[self._cache_key] = _CachedAccessToken(
+                access_token=self.token.access_token,
+                expires_in=self.token.expires_in,
+                expires_at=self.expires_at,
+            )
+            # The file is replaced atomically so that concurrent processes
+            # never read a partially written file.
+            temporary_path = self.cache_path.with_name(
+                f".{self.cache_path.name}.{os.getpid()}.tmp"
+            )
+            try:
+                fd = os.open(
+                    temporary_path,
+                    os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                    0o600,
+                )
+                with os.fdopen(fd, "w") as handle:
+                    json.dump(
+                        {key: cached.dict() for key, cached in cache.items()},
+                        handle,
+                    )
+                os.replace(temporary_path, self.cache_path)
+            except OSError as err:
+                logging.warning(f"Storing access token failed: {err}")
+
+    def close(self) -> None:
+        """Stop refreshing the token in the background"""
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
 class AuthenticatorBase(ABC):
     @abstractmethod
     def perform_request(
@@ -82,6 +296,35 @@ class AuthenticatorBase(ABC):
     ) -> requests.Response:
         """Perform authenticated request"""
 
+    def perform_upload(
+        self,
+        session: requests.Session,
+        request: requests.Request,
+        check_request: requests.Request,
+    ) -> requests.Response:
+        """Perform authenticated request whose body should only be sent once.
+
+        Authenticators that send requests again after refreshing rejected
+        credentials first perform `check_request`, which should be a cheap
+        authenticated request, unless their credentials are already known to
+        be accepted.
+        """
+        return self.perform_request(session, request)
+
+
+def _rewind_body(prepared_request: requests.PreparedRequest) -> None:
+    body = prepared_request.body
+    if body is None or isinstance(body, (bytes, str)):
+        return
+    rewind = getattr(body, "rewind", None)
+    if rewind is not None:
+        rewind()
+    elif getattr(prepared_request, "_body_position", None) is not None:
+        requests.utils.rewind_body(prepared_request)
+    else:
+        # Sending the body again would send whatever is left of it.
+        raise UnrewindableBodyError("Unable to rewind request body")
+
 
 class OAuthClientCredentialsAuthenticator(AuthenticatorBase):
     def __init__(
@@ -98,52 +341,81 @@ class OAuthClientCredentialsAuthenticator(AuthenticatorBase):
         audience: str = LOCALLY_MANAGED_CLIENT_AUDIENCE,
         # Scopes for access tokens
         scopes: Iterable[Scope] = DEFAULT_SCOPES,
+        # Time in seconds before expiry at which tokens are refreshed
+        refresh_margin: float = DEFAULT_REFRESH_MARGIN,
+        # Whether tokens are refreshed in the background before they expire
+        background_refresh: bool = True,
+        # Path of file in which tokens are persisted between processes
+        token_cache_path: Optional[Union[str, Path]] = None,
     ):
         self.client = OAuthClientCredentialsClient(session, service_url)
         self.client_id = client_id
         self.client_secret = client_secret
         self.audience = audience
         self.scopes = frozenset(scopes)
-        self.token: Optional[OAuthAccessToken] = None
+        self.tokens = OAuthTokenManager(
+            self.client,
+            client_id,
+            client_secret,
+            audience,
+            self.scopes,
+            refresh_margin=refresh_margin,
+            background_refresh=background_refresh,
+            cache_path=token_cache_path,
+        )
+        # Latest token that the server has accepted
+        self._accepted_token: Optional[str] = None
+
+    @property
+    def token(self) -> Optional[OAuthAccessToken]:
+        return self.tokens.token
 
     def perform_request(
         self,
         session: requests.Session,
         request: requests.Request,
     ) -> requests.Response:
-        if self.token is None:
-            self.token = self.client.get_access_token(
-                self.client_id,
-                self.client_secret,
-                self.audience,
-                self.scopes,
-            )
-        response = self._send_request(session, request)
+        token = self.tokens.get_token()
+        # The request is prepared only once, and if it is rejected, the same
+        # prepared request is sent again with its body rewound.
+        prepared_request = session.prepare_request(request)
+        response = self._send_request(session, prepared_request, token)
         if response.status_code != 401:
+            self._accepted_token = token
             return response
         logging.debug("Received unauthorized response, refreshing access token.")
-        self.token = self.client.get_access_token(
-            self.client_id,
-            self.client_secret,
-            self.audience,
-            self.scopes,
-        )
-        response = self._send_request(session, request)
+        token = self.tokens.get_token(rejected=token)
+        _rewind_body(prepared_request)
+        response = self._send_request(session, prepared_request, token)
         if response.status_code == 401:
             raise APIException(
                 "Authentication failed",
                 "Performing authenticated request failed",
             )
+        self._accepted_token = token
         return response
 
-    def _send_request(
+    def perform_upload(
         self,
         session: requests.Session,
         request: requests.Request,
+        check_request: requests.Request,
     ) -> requests.Response:
-        assert self.token is not None
-        request.headers["Authorization"] = f"Bearer {self.token.access_token}"
-        prepared_request = session.prepare_request(request)
+        if self.tokens.get_token() != self._accepted_token:
+            logging.debug("Checking access token before uploading.")
+            self.perform_request(session, check_request)
+        return self.perform_request(session, request)
+
+    def close(self) -> None:
+        self.tokens.close()
+
+    def _send_request(
+        self,
+        session: requests.Session,
+        prepared_request: requests.PreparedRequest,
+        token: str,
+    ) -> requests.Response:
+        prepared_request.headers["Authorization"] = f"Bearer {token}"
         return session.send(prepared_request)
 
 
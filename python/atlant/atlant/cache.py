@@ -0,0 +1,314 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, OrderedDict, Union
+
+from .scan import (
+    ScanClient,
+    ScanMetadata,
+    ScanResponse,
+    ScanStatus,
+    scan_response_from_json,
+)
+from .serialization import loads
+from .stats import StatsClient
+
+# Default time in seconds for which cached verdicts are used.
+DEFAULT_TTL = 3600
+
+# Default time in seconds between checks for new definition updates.
+DEFAULT_DEFINITIONS_CHECK_INTERVAL = 60
+
+DEFAULT_MEMORY_STORE_SIZE = 100_000
+
+
+@dataclass
+class CachedVerdict:
+    response: ScanResponse
+    # Time when the verdict was stored, as returned by time.time()
+    stored_at: float
+    # Time of the latest definition update when the verdict was stored
+    definition_update: Optional[datetime]
+
+
+class VerdictStore(ABC):
+    """Storage for cached verdicts.
+
+    Implementations must be safe to use from multiple threads.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CachedVerdict]:
+        """Look up a cached verdict"""
+
+    @abstractmethod
+    def put(self, key: str, verdict: CachedVerdict) -> None:
+        """Store a verdict, replacing any previous verdict for the same key"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all cached verdicts"""
+
+
+class MemoryVerdictStore(VerdictStore):
+    """In-memory verdict store evicting the least recently used verdicts"""
+
+    def __init__(self, max_size: int = DEFAULT_MEMORY_STORE_SIZE):
+        self.max_size = max_size
+        self._verdicts: OrderedDict[str, CachedVerdict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedVerdict]:
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                self._verdicts.move_to_end(key)
+            return verdict
+
+    def put(self, key: str, verdict: CachedVerdict) -> None:
+        with self._lock:
+            self._verdicts[key] = verdict
+            self._verdicts.move_to_end(key)
+            while len(self._verdicts) > self.max_size:
+                self._verdicts.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._verdicts.clear()
+
+
+class SQLiteVerdictStore(VerdictStore):
+    """Verdict store persisted in an SQLite database"""
+
+    def __init__(self, path: Union[str, Path]):
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "key TEXT PRIMARY KEY, "
+                "response TEXT NOT NULL, "
+                "stored_at REAL NOT NULL, "
+                "definition_update TEXT)"
+            )
+
+    def get(self, key: str) -> Optional[CachedVerdict]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, stored_at, definition_update "
+                "FROM verdicts WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        response, stored_at, definition_update = row
+        return CachedVerdict(
+            response=scan_response_from_json(loads(response)),
+            stored_at=stored_at,
+            definition_update=(
+                datetime.fromisoformat(definition_update)
+                if definition_update is not None
+                else None
+            ),
+        )
+
+    def put(self, key: str, verdict: CachedVerdict) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)",
+                (
+                    key,
+                    verdict.response.json(exclude={"poll_settings"}),
+                    verdict.stored_at,
+                    (
+                        verdict.definition_update.isoformat()
+                        if verdict.definition_update is not None
+                        else None
+                    ),
+                ),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM verdicts")
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class DefinitionUpdateTracker:
+    """Keeps track of the time of the latest definition update.
+
+    The time is fetched from the stats API at most once per `check_interval`
+    seconds, so a single tracker can be shared by any number of threads.
+    """
+
+    def __init__(
+        self,
+        stats_client: StatsClient,
+        check_interval: float = DEFAULT_DEFINITIONS_CHECK_INTERVAL,
+    ):
+        self.stats_client = stats_client
+        self.check_interval = check_interval
+        self._latest: Optional[datetime] = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def latest(self) -> datetime:
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._latest is None
+                or self._checked_at is None
+                or now - self._checked_at >= self.check_interval
+            ):
+                latest = self.stats_client.latest_definition_update_time()
+                if self._latest is not None and latest != self._latest:
+                    logging.debug(f"Definitions were updated at {latest}.")
+                self._latest = latest
+                self._checked_at = now
+            return self._latest
+
+
+class CachingScanClient:
+    """Scanning client caching completed verdicts by SHA-1 hash.
+
+    Scans are cached when the scan metadata contains the SHA-1 hash of the
+    content. Uploads of content that does not match the hash raise
+    `ContentHashMismatchError` and are not cached. Cached verdicts are used
+    for at most `ttl` seconds, and never once the definitions have been updated
+    after the verdict was stored.
+    """
+
+    def __init__(
+        self,
+        client: ScanClient,
+        store: VerdictStore,
+        ttl: float = DEFAULT_TTL,
+        definitions: Optional[DefinitionUpdateTracker] = None,
+    ):
+        self.client = client
+        self.store = store
+        self.ttl = ttl
+        self.definitions = definitions
+        self._definition_update: Optional[datetime] = None
+        # Cache keys of pending scans by their poll path
+        self._pending: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(metadata: ScanMetadata) -> Optional[str]:
+        if metadata.content_meta is None or metadata.content_meta.sha1 is None:
+            return None
+        sha1 = metadata.content_meta.sha1.lower()
+        if metadata.scan_settings is None:
+            return sha1
+        # Verdicts depend on scan settings, so scans with different settings
+        # are cached separately.
+        settings = metadata.scan_settings.encode()
+        return f"{sha1}:{hashlib.sha1(settings).hexdigest()}"
+
+    def _latest_definition_update(self) -> Optional[datetime]:
+        if self.definitions is None:
+            return None
+        latest = self.definitions.latest()
+        with self._lock:
+            if (
+                self._definition_update is not None
+                and latest != self._definition_update
+            ):
+                self.store.clear()
+            self._definition_update = latest
+        return latest
+
+    def _lookup(self, key: Optional[str]) -> Optional[ScanResponse]:
+        if key is None:
+            return None
+        verdict = self.store.get(key)
+        if verdict is None:
+            return None
+        if time.time() - verdict.stored_at > self.ttl:
+            return None
+        if verdict.definition_update != self._latest_definition_update():
+            return None
+        logging.debug(f"Using cached verdict for {key}.")
+        return verdict.response
+
+    def _store(self, key: Optional[str], response: ScanResponse) -> None:
+        if key is None or response.status != ScanStatus.COMPLETE:
+            return
+        # A response asking for the content is not a verdict for the content.
+        if response.warnings.need_content:
+            return
+        self.store.put(
+            key,
+            CachedVerdict(
+                response=response,
+                stored_at=time.time(),
+                definition_update=self._latest_definition_update(),
+            ),
+        )
+
+    def scan(
+        self,
+        metadata: ScanMetadata,
+        file: Optional[BinaryIO] = None,
+    ) -> ScanResponse:
+        """Perform a scan, using a cached verdict if one is available"""
+        key = self.cache_key(metadata)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        response = self.client.scan(metadata, file)
+        if response.status == ScanStatus.PENDING and key is not None:
+            assert response.poll_settings is not None
+            with self._lock:
+                self._pending[response.poll_settings.poll_path] = key
+        self._store(key, response)
+        return response
+
+    def scan_hash(self, sha1: str) -> ScanResponse:
+        """Perform a scan by SHA-1 hash, using a cached verdict if one is
+        available"""
+        key = sha1.lower()
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        response = self.client.scan_hash(sha1)
+        if response.status == ScanStatus.PENDING:
+            assert response.poll_settings is not None
+            with self._lock:
+                self._pending[response.poll_settings.poll_path] = key
+        self._store(key, response)
+        return response
+
+    def poll(self, poll_path: str) -> ScanResponse:
+        """Poll a pending scan task"""
+        response = self.client.poll(poll_path)
+        if response.status == ScanStatus.COMPLETE:
+            with self._lock:
+                key = self._pending.pop(poll_path, None)
+            self._store(key, response)
+        return response
+
+    def scan_until_completion(
+        self,
+        metadata: ScanMetadata,
+        file: Optional[BinaryIO] = None,
+    ) -> ScanResponse:
+        """Perform a scan and poll until the scan is fully completed, using a
+        cached verdict if one is available"""
+        key = self.cache_key(metadata)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        response = self.client.scan_until_completion(metadata, file)
+        self._store(key, response)
+        return response
@@ -0,0 +1,249 @@
+import logging
+import sys
+import time
+import urllib.parse
+from concurrent import futures
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+
+from atlant.auth import Scope
+from atlant.cache import (
+    DEFAULT_MEMORY_STORE_SIZE,
+    CachedVerdict,
+    MemoryVerdictStore,
+    VerdictStore,
+)
+from atlant.cli import config_file
+from atlant.cli.output import NDJSONWriter
+from atlant.cli.scan_dir import parse_positive_int
+from atlant.pipeline import DEFAULT_LOOKUP_WORKERS, DEFAULT_MAX_PENDING
+from atlant.scan import ScanClient, ScanContentMetadata, ScanMetadata, ScanResponse
+
+# Ports that are left out of normalized URLs.
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+@dataclass
+class URLClassification:
+    url: str
+    categories: List[str]
+    # Description of the error if the URL could not be classified
+    error: Optional[str] = None
+
+
+def install(parser: Any) -> None:
+    parser = parser.add_parser(
+        "classify-urls",
+        description="Classify URL addresses read one per line.",
+    )
+    parser.add_argument(
+        "--dedupe",
+        choices=["url", "host"],
+        default="url",
+        help="Classify each distinct normalized URL (url, the default) or only "
+        "the first URL of each host (host).",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="INT",
+        type=parse_positive_int,
+        default=DEFAULT_LOOKUP_WORKERS,
+        help="Maximum number of concurrent classifications (default: "
+        f"{DEFAULT_LOOKUP_WORKERS}).",
+    )
+    parser.add_argument(
+        "--cache-size",
+        metavar="INT",
+        type=parse_positive_int,
+        default=DEFAULT_MEMORY_STORE_SIZE,
+        help="Maximum number of classifications kept in memory (default: "
+        f"{DEFAULT_MEMORY_STORE_SIZE}).",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="PATH",
+        type=Path,
+        help="Write results to a file instead of standard output.",
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        type=Path,
+        help="File to read URL addresses from. Standard input is read if this "
+        "is not given.",
+    )
+    parser.set_defaults(action=command)
+
+
+def normalize_url(url: str) -> str:
+    """Normalize URL so that equivalent URLs are classified only once"""
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").rstrip(".")
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    return urllib.parse.urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def url_host(url: str) -> Optional[str]:
+    """Return the host of a URL, or None if it has no host.
+
+    URLs without a scheme, such as those in proxy logs, are parsed as if they
+    started with `//`.
+    """
+    if "//" not in url:
+        url = "//" + url
+    host = (urllib.parse.urlsplit(url).hostname or "").rstrip(".")
+    return host or None
+
+
+def read_urls(stream: IO[str]) -> Iterator[str]:
+    for line in stream:
+        url = line.strip()
+        if url:
+            yield url
+
+
+def classify_urls(
+    client: ScanClient,
+    urls: Iterable[str],
+    key_function: Callable[[str], Optional[str]] = normalize_url,
+    store: Optional[VerdictStore] = None,
+    jobs: int = DEFAULT_LOOKUP_WORKERS,
+    max_pending: int = DEFAULT_MAX_PENDING,
+) -> Iterator[URLClassification]:
+    """Classify URLs, yielding the categories of each URL.
+
+    URLs with the same key are classified only once: URLs read while a URL
+    with the same key is being classified wait for its result, and later ones
+    use the result cached in `store`. URLs for which `key_function` returns
+    None are each classified separately. Results are yielded in the order the
+    classifications complete.
+
+    A URL that cannot be classified, or whose key cannot be determined, is
+    yielded with an error instead of stopping the classification of the rest.
+    """
+    if store is None:
+        store = MemoryVerdictStore()
+
+    def classify(url: str) -> ScanResponse:
+        metadata = ScanMetadata(content_meta=ScanContentMetadata(uri=url))
+        return client.scan_until_completion(metadata)
+
+    with futures.ThreadPoolExecutor(
+        max_workers=jobs,
+        thread_name_prefix="ClassifyThread",
+    ) as pool:
+        # URLs waiting for the classification of their key
+        waiting: Dict[str, List[str]] = {}
+        tasks: Dict[
+            "futures.Future[ScanResponse]", Tuple[Optional[str], List[str]]
+        ] = {}
+        pending = 0
+        pending_urls = iter(urls)
+        exhausted = False
+        while True:
+            while not exhausted and pending < max_pending:
+                url = next(pending_urls, None)
+                if url is None:
+                    exhausted = True
+                    break
+                try:
+                    key = key_function(url)
+                except ValueError as err:
+                    yield URLClassification(url, [], f"Invalid URL: {err}")
+                    continue
+                if key is not None:
+                    if key in waiting:
+                        waiting[key].append(url)
+                        pending += 1
+                        continue
+                    cached = store.get(key)
+                    if cached is not None:
+                        yield URLClassification(
+                            url, cached.response.uri_categories or []
+                        )
+                        continue
+                key_urls = [url]
+                if key is not None:
+                    waiting[key] = key_urls
+                pending += 1
+                tasks[pool.submit(classify, url)] = (key, key_urls)
+            if not tasks:
+                break
+            finished_tasks, _ = futures.wait(
+                tasks,
+                return_when=futures.FIRST_COMPLETED,
+            )
+            for finished in finished_tasks:
+                key, key_urls = tasks.pop(finished)
+                if key is not None:
+                    del waiting[key]
+                try:
+                    response = finished.result()
+                except Exception as err:
+                    # Failures are not cached, so later URLs with the same key
+                    # are classified again.
+                    results = [URLClassification(url, [], str(err)) for url in key_urls]
+                else:
+                    if key is not None:
+                        store.put(key, CachedVerdict(response, time.time(), None))
+                    categories = response.uri_categories or []
+                    results = [URLClassification(url, categories) for url in key_urls]
+                for result in results:
+                    pending -= 1
+                    yield result
+
+
+def command(
+    *,
+    session: requests.Session,
+    config: config_file.Config,
+    dedupe: str,
+    jobs: int,
+    cache_size: int,
+    output: Optional[Path],
+    input: Optional[Path],
+) -> None:
+    config.http.configure_session(session, jobs)
+    client = ScanClient(
+        session,
+        config.scanning_url,
+        config.get_authenticator(session, [Scope.SCAN]),
+    )
+    with ExitStack() as stack:
+        input_stream = (
+            stack.enter_context(input.open()) if input is not None else sys.stdin
+        )
+        output_stream = (
+            stack.enter_context(output.open("wb"))
+            if output is not None
+            else sys.stdout.buffer
+        )
+        results = classify_urls(
+            client,
+            read_urls(input_stream),
+            url_host if dedupe == "host" else normalize_url,
+            MemoryVerdictStore(cache_size),
+            jobs,
+        )
+        # Results are written as soon as they are available.
+        with NDJSONWriter(output_stream) as writer:
+            for result in results:
+                if result.error is not None:
+                    logging.warning(
+                        f"Classifying URL {result.url} failed: {result.error}"
+                    )
+                    writer.write({"url": result.url, "error": result.error})
+                else:
+                    writer.write({"url": result.url, "categories": result.categories})
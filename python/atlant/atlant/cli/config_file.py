@@ -1,12 +1,13 @@
 import logging
 import os
+import threading
 from configparser import ConfigParser
 from enum import Enum
 from pathlib import Path
-from typing import List, Literal, Optional, Union
+from typing import Dict, FrozenSet, List, Literal, Optional, Tuple, Union
 
 import requests
-from pydantic import BaseModel, FilePath, HttpUrl
+from pydantic import BaseModel, FilePath, HttpUrl, PrivateAttr
 
 from atlant.auth import (
     LOCALLY_MANAGED_CLIENT_AUDIENCE,
@@ -16,6 +17,11 @@ from atlant.auth import (
     OAuthClientCredentialsAuthenticator,
     Scope,
 )
+from atlant.session import (
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_POOL_CONNECTIONS,
+    configure_session,
+)
 
 CONFIG_FILE_NAME = "atlant.ini"
 PACKAGE_NAME = "atlant"
@@ -27,6 +33,7 @@ class OAuthConfig(BaseModel):
     client_secret: str
     audience: str = LOCALLY_MANAGED_CLIENT_AUDIENCE
     authorization_url: HttpUrl
+    token_cache_path: Optional[Path] = None
 
 
 class APIKeyConfig(BaseModel):
@@ -34,6 +41,32 @@ class APIKeyConfig(BaseModel):
     api_key: str
 
 
+class HTTPConfig(BaseModel):
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS
+    max_connections: Optional[int] = None
+    keep_alive: bool = True
+    connect_timeout: Optional[float] = None
+    read_timeout: Optional[float] = None
+    retries: int = 0
+    retry_backoff: float = 0
+
+    def configure_session(
+        self,
+        session: requests.Session,
+        default_max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    ) -> None:
+        configure_session(
+            session,
+            pool_connections=self.pool_connections,
+            max_connections=self.max_connections or default_max_connections,
+            keep_alive=self.keep_alive,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            retries=self.retries,
+            retry_backoff=self.retry_backoff,
+        )
+
+
 class LogLevel(Enum):
     CRITICAL = "critical"
     ERROR = "error"
@@ -57,11 +90,34 @@ class Config(BaseModel):
     authentication: Union[OAuthConfig, APIKeyConfig, None] = None
     certificate_path: Optional[FilePath] = None
     log_level: Optional[LogLevel] = None
+    http: HTTPConfig = HTTPConfig()
+
+    # Authenticators already created for each session and set of scopes
+    _authenticators: Dict[
+        Tuple[requests.Session, FrozenSet[Scope]], AuthenticatorBase
+    ] = PrivateAttr(default_factory=dict)
+    _authenticators_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
 
     def get_authenticator(
         self,
         session: requests.Session,
         scopes: List[Scope],
+    ) -> AuthenticatorBase:
+        """Get authenticator for the given scopes.
+
+        The same authenticator is returned for every call with the same
+        session and scopes, so access tokens are shared by all of its users.
+        """
+        key = (session, frozenset(scopes))
+        with self._authenticators_lock:
+            if key not in self._authenticators:
+                self._authenticators[key] = self._create_authenticator(session, scopes)
+            return self._authenticators[key]
+
+    def _create_authenticator(
+        self,
+        session: requests.Session,
+        scopes: List[Scope],
     ) -> AuthenticatorBase:
         if isinstance(self.authentication, OAuthConfig):
             return OAuthClientCredentialsAuthenticator(
@@ -71,6 +127,7 @@ class Config(BaseModel):
                 self.authentication.client_secret,
                 self.authentication.audience,
                 scopes,
+                token_cache_path=self.authentication.token_cache_path,
             )
         elif isinstance(self.authentication, APIKeyConfig):
             return APIKeyAuthenticator(self.authentication.api_key)
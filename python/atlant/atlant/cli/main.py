@@ -5,7 +5,15 @@ from typing import Any, Dict
 
 import requests
 
-from . import classify_url, config, config_file, get_access_token, scan_dir, scan_file
+from . import (
+    classify_url,
+    classify_urls,
+    config,
+    config_file,
+    get_access_token,
+    scan_dir,
+    scan_file,
+)
 
 
 def parse_args() -> Dict[str, Any]:
@@ -21,6 +29,7 @@ def parse_args() -> Dict[str, Any]:
     get_access_token.install(subparsers)
     config.install(subparsers)
     classify_url.install(subparsers)
+    classify_urls.install(subparsers)
     scan_file.install(subparsers)
     scan_dir.install(subparsers)
     return vars(parser.parse_args())
@@ -39,4 +48,5 @@ def main() -> None:
     with requests.Session() as session:
         if config.certificate_path is not None:
             session.verify = str(config.certificate_path)
+        config.http.configure_session(session)
         sub_command(session=session, config=config, **args)
@@ -0,0 +1,100 @@
+import threading
+import time
+from types import TracebackType
+from typing import IO, Any, Optional, Type
+
+from atlant.serialization import dumps
+
+# Default number of records after which buffered output is flushed.
+DEFAULT_FLUSH_COUNT = 100
+
+# Default time in seconds after which buffered output is flushed.
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+
+class NDJSONWriter:
+    """Writes records as newline delimited JSON.
+
+    Records are written to the stream as soon as they are received, but the
+    stream is flushed only every `flush_count` records or `flush_interval`
+    seconds, whichever comes first. While the writer is used as a context
+    manager, a background thread flushes records that have waited for
+    `flush_interval` seconds even if no further records are written.
+    """
+
+    def __init__(
+        self,
+        stream: IO[bytes],
+        flush_count: int = DEFAULT_FLUSH_COUNT,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.stream = stream
+        self.flush_count = flush_count
+        self.flush_interval = flush_interval
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+        # Writes and flushes happen both in the caller's thread and in the
+        # flush thread.
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+
+    def write(self, record: Any) -> None:
+        data = dumps(record) + b"\n"
+        with self._lock:
+            self.stream.write(data)
+            self._unflushed += 1
+            if (
+                self._unflushed >= self.flush_count
+                or time.monotonic() - self._flushed_at >= self.flush_interval
+            ):
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.stream.flush()
+        self._unflushed = 0
+        self._flushed_at = time.monotonic()
+
+    def _flush_periodically(self) -> None:
+        timeout = self.flush_interval
+        while not self._stopped.wait(timeout):
+            with self._lock:
+                if not self._unflushed:
+                    timeout = self.flush_interval
+                    continue
+                elapsed = time.monotonic() - self._flushed_at
+                if elapsed >= self.flush_interval:
+                    try:
+                        self._flush()
+                    except OSError:
+                        # The error is raised again by the next write or flush
+                        # in the caller's thread.
+                        return
+                    elapsed = 0
+                timeout = self.flush_interval - elapsed
+
+    def __enter__(self) -> "NDJSONWriter":
+        self._stopped.clear()
+        self._flush_thread = threading.Thread(
+            target=self._flush_periodically,
+            name="FlushThread",
+            daemon=True,
+        )
+        self._flush_thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self._stopped.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush()
@@ -1,17 +1,44 @@
-import hashlib
 import json
-import logging
-import threading
-from concurrent import futures
-from dataclasses import dataclass
+import os
+import sys
+from argparse import ArgumentTypeError
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Any, Dict, Iterable, Union, cast
+from typing import Any, Iterable, Iterator, Optional
 
 import requests
 
 from atlant.auth import Scope
+from atlant.cache import (
+    CachingScanClient,
+    DefinitionUpdateTracker,
+    SQLiteVerdictStore,
+    VerdictStore,
+)
 from atlant.cli import config_file
-from atlant.scan import ScanClient, ScanContentMetadata, ScanMetadata, ScanResponse
+from atlant.cli.output import NDJSONWriter
+from atlant.pipeline import (
+    DEFAULT_HASH_WORKERS,
+    DEFAULT_LOOKUP_WORKERS,
+    FileScanResult,
+    Scanner,
+    ScanPipeline,
+    shared_client_factory,
+)
+from atlant.poll import DEFAULT_MAX_IN_FLIGHT
+from atlant.scan import ScanClient
+from atlant.state import ScanStateIndex
+from atlant.stats import StatsClient
+
+
+def parse_positive_int(value: str) -> int:
+    try:
+        result = int(value)
+    except ValueError as err:
+        raise ArgumentTypeError("Integer expected") from err
+    if result < 1:
+        raise ArgumentTypeError("Positive integer expected")
+    return result
 
 
 def install(parser: Any) -> None:
@@ -25,119 +52,124 @@ def install(parser: Any) -> None:
         action="store_true",
         help="Recursively scan files from subdirectories.",
     )
+    parser.add_argument(
+        "--verdict-cache",
+        metavar="PATH",
+        type=Path,
+        help="Cache verdicts by file hash in an SQLite database.",
+    )
+    parser.add_argument(
+        "--state-file",
+        metavar="PATH",
+        type=Path,
+        help="Skip files that have not changed since they were last scanned.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="INT",
+        type=parse_positive_int,
+        default=DEFAULT_LOOKUP_WORKERS,
+        help="Maximum number of concurrent hash lookups and of concurrent "
+        f"uploads (default: {DEFAULT_LOOKUP_WORKERS}).",
+    )
+    parser.add_argument(
+        "--hash-jobs",
+        metavar="INT",
+        type=parse_positive_int,
+        default=DEFAULT_HASH_WORKERS,
+        help="Maximum number of files hashed concurrently (default: number of "
+        "CPUs).",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["json", "ndjson"],
+        default="json",
+        help="Output all results as one JSON object at the end (json, the "
+        "default), or each result as a JSON line as soon as it is available "
+        "(ndjson).",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="PATH",
+        type=Path,
+        help="Write results to a file instead of standard output.",
+    )
     parser.add_argument("dir", type=Path, help="Directory to scan.")
     parser.set_defaults(action=command)
 
 
-def list_files(dir: Path, recursive: bool) -> Iterable[Path]:
-    return (path for path in dir.glob("**" if recursive else "*") if path.is_file())
-
-
-@dataclass
-class FileScanResult:
-    path: Path
-    hash: str
-    result: ScanResponse
+def list_files(dir: Path, recursive: bool) -> Iterator[Path]:
+    # Directories are walked lazily with os.scandir, which on most platforms
+    # gets the type of each entry from the directory listing without a stat.
+    # Symbolic links to directories are not followed to avoid loops.
+    dirs = [dir]
+    while dirs:
+        with os.scandir(dirs.pop()) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    yield Path(entry.path)
+                elif recursive and entry.is_dir(follow_symlinks=False):
+                    dirs.append(Path(entry.path))
 
 
 def scan_files(
     session: requests.Session,
     config: config_file.Config,
     files: Iterable[Path],
-) -> Iterable[FileScanResult]:
-    # Here we do scanning in two steps: first, we try to scan the file using the
-    # hash of its content without actually sending the full file for scanning.
-    # For some files, this is enough and Atlant can identify the file using its
-    # hash alone. For files where the hash is not enough to conclusively
-    # identify the file, the response from Atlant will have the 'need_content'
-    # warning set. In this case we proceed to send the file for a full scan.
-
-    thread_context = threading.local()
-
-    @dataclass
-    class HashScanResult:
-        hash: str
-        response: ScanResponse
-
-    @dataclass
-    class HashScanContext:
-        path: Path
-
-    @dataclass
-    class ContentScanContext:
-        path: Path
-        hash: str
+    verdict_store: Optional[VerdictStore] = None,
+    state_file: Optional[Path] = None,
+    jobs: int = DEFAULT_LOOKUP_WORKERS,
+    hash_jobs: int = DEFAULT_HASH_WORKERS,
+) -> Iterator[FileScanResult]:
+    # Lookup, upload and poll threads all share the session, so its connection
+    # pool is sized for all of them unless configured explicitly.
+    config.http.configure_session(session, 2 * jobs + DEFAULT_MAX_IN_FLIGHT)
+    # Cached verdicts and recorded scan state are invalidated by definition
+    # updates, which can only be tracked if the management service is
+    # available.
+    definitions: Optional[DefinitionUpdateTracker] = None
+    if verdict_store is not None and config.management_url is None:
+        raise Exception("Management URL must be specified for verdict caching.")
+    if state_file is not None and config.management_url is None:
+        raise Exception("Management URL must be specified for incremental scanning.")
+    if verdict_store is not None or state_file is not None:
+        assert config.management_url is not None
+        definitions = DefinitionUpdateTracker(
+            StatsClient(
+                session,
+                config.management_url,
+                config.get_authenticator(session, [Scope.MANAGEMENT]),
+            )
+        )
 
-    def initialize_thread() -> None:
-        logging.debug("Initializing scanner thread.")
-        thread_context.client = ScanClient(
+    def create_client() -> Scanner:
+        client = ScanClient(
             session,
             config.scanning_url,
             config.get_authenticator(session, [Scope.SCAN]),
         )
-
-    def scan_with_content_hash(path: Path) -> HashScanResult:
-        logging.debug(f"Scanning {path} using a hash of its content.")
-        hash = hashlib.sha1(path.read_bytes()).hexdigest()
-        scan_metadata = ScanMetadata(content_meta=ScanContentMetadata(sha1=hash))
-        response = thread_context.client.scan_until_completion(scan_metadata)
-        return HashScanResult(hash, response)
-
-    def scan_with_content(path: Path) -> ScanResponse:
-        logging.debug(f"Scanning {path} using its content.")
-        with path.open("rb") as handle:
-            return cast(
-                ScanResponse,
-                thread_context.client.scan_until_completion(ScanMetadata(), handle),
-            )
-
-    with futures.ThreadPoolExecutor(
-        thread_name_prefix="ScanThread",
-        initializer=initialize_thread,
-    ) as thread_pool:
-        task_contexts: Dict[
-            futures.Future[Any], Union[HashScanContext, ContentScanContext]
-        ] = {
-            thread_pool.submit(scan_with_content_hash, path): HashScanContext(path)
-            for path in files
-        }
-        tasks = set(task_contexts)
-
-        while tasks:
-            finished_tasks, tasks = futures.wait(
-                tasks,
-                return_when=futures.FIRST_COMPLETED,
-            )
-            for finished in finished_tasks:
-                context = task_contexts.pop(finished)
-                if isinstance(context, HashScanContext):
-                    hash_scan_result: HashScanResult = finished.result()
-                    # If the need_content flag is set in the response it means
-                    # the result from the hash based scan is not conclusive and
-                    # the file should be submitted for a full scan.
-                    if hash_scan_result.response.warnings.need_content:
-                        logging.debug(f"Submitting {context.path} for a content scan.")
-                        future = thread_pool.submit(scan_with_content, context.path)
-                        task_contexts[future] = ContentScanContext(
-                            path=context.path,
-                            hash=hash_scan_result.hash,
-                        )
-                        tasks.add(future)
-                    else:
-                        yield FileScanResult(
-                            path=context.path,
-                            hash=hash_scan_result.hash,
-                            result=hash_scan_result.response,
-                        )
-                elif isinstance(context, ContentScanContext):
-                    content_scan_result: ScanResponse = finished.result()
-                    yield FileScanResult(
-                        path=context.path,
-                        hash=context.hash,
-                        result=content_scan_result,
-                    )
-                else:
-                    assert False
+        if verdict_store is not None:
+            return CachingScanClient(client, verdict_store, definitions=definitions)
+        return client
+
+    with ExitStack() as stack:
+        state: Optional[ScanStateIndex] = None
+        if state_file is not None:
+            assert definitions is not None
+            state = ScanStateIndex(state_file, definitions)
+            stack.callback(state.close)
+        # All threads share one client, and with it one authenticator, so that
+        # an access token is fetched once instead of once in each thread.
+        pipeline = ScanPipeline(
+            shared_client_factory(create_client),
+            hash_workers=hash_jobs,
+            lookup_workers=jobs,
+            upload_workers=jobs,
+            state=state,
+        )
+        yield from pipeline.scan(files)
 
 
 def command(
@@ -145,13 +177,51 @@ def command(
     session: requests.Session,
     config: config_file.Config,
     recursive: bool,
+    verdict_cache: Optional[Path],
+    state_file: Optional[Path],
+    jobs: int,
+    hash_jobs: int,
+    output_format: str,
+    output: Optional[Path],
     dir: Path,
 ) -> None:
-    results = {
-        str(result.path): {
-            "sha1_hash": result.hash,
-            "result": json.loads(result.result.json()),
-        }
-        for result in scan_files(session, config, list_files(dir, recursive))
-    }
-    print(json.dumps(results, indent=2))
+    with ExitStack() as stack:
+        verdict_store: Optional[VerdictStore] = None
+        if verdict_cache is not None:
+            verdict_store = SQLiteVerdictStore(verdict_cache)
+            stack.callback(verdict_store.close)
+        stream = (
+            stack.enter_context(output.open("wb"))
+            if output is not None
+            else sys.stdout.buffer
+        )
+        results = scan_files(
+            session,
+            config,
+            list_files(dir, recursive),
+            verdict_store,
+            state_file,
+            jobs,
+            hash_jobs,
+        )
+        if output_format == "ndjson":
+            # Results are written as soon as they are available.
+            with NDJSONWriter(stream) as writer:
+                for result in results:
+                    writer.write(
+                        {
+                            "path": str(result.path),
+                            "sha1_hash": result.hash,
+                            "result": result.result.dict(),
+                        }
+                    )
+        else:
+            report = {
+                str(result.path): {
+                    "sha1_hash": result.hash,
+                    "result": json.loads(result.result.json()),
+                }
+                for result in results
+            }
+            stream.write(json.dumps(report, indent=2).encode("utf-8") + b"\n")
+            stream.flush()
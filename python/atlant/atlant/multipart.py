@@ -0,0 +1,177 @@
+import hashlib
+import io
+import os
+import stat
+from typing import BinaryIO, Final, Iterator, List, Optional, Sequence, Tuple, Union
+
+from requests.exceptions import UnrewindableBodyError
+
+NEWLINE: Final[bytes] = b"\r\n"
+
+# Size of the pieces in which file parts are read while sending the body.
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+PartContent = Union[bytes, BinaryIO]
+Field = Tuple[str, PartContent, str]
+
+
+class FileChangedError(Exception):
+    """File changed while it was being sent"""
+
+
+def remaining_length(file: BinaryIO) -> Optional[int]:
+    """Number of bytes left in the file, or None if it cannot be determined"""
+    try:
+        position = file.tell()
+    except (OSError, io.UnsupportedOperation):
+        return None
+    try:
+        file_stat = os.fstat(file.fileno())
+    except (OSError, io.UnsupportedOperation, AttributeError):
+        pass
+    else:
+        if stat.S_ISREG(file_stat.st_mode):
+            return max(0, file_stat.st_size - position)
+    try:
+        end = file.seek(0, io.SEEK_END)
+        file.seek(position)
+    except (OSError, io.UnsupportedOperation):
+        return None
+    return max(0, end - position)
+
+
+def _tell(file: BinaryIO) -> Optional[int]:
+    try:
+        if not file.seekable():
+            return None
+        return file.tell()
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MultipartEncoder:
+    """Streaming multipart/form-data encoder.
+
+    File parts are read in pieces of at most `chunk_size` bytes while the body
+    is being sent, so the memory used does not depend on the size of the files.
+    The SHA-1 hash of each file part is computed while it is sent and is
+    available in `file_hashes` once the body has been sent.
+    The encoder can be passed as the `data` of a `requests.Request`, in which
+    case requests sends it with a Content-Length header when the length of all
+    the parts is known and with chunked transfer encoding otherwise.
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[Field],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        boundary: Optional[str] = None,
+    ):
+        self.boundary = boundary if boundary is not None else os.urandom(16).hex()
+        self.chunk_size = chunk_size
+        self._parts: List[Tuple[bytes, PartContent]] = []
+        # Initial position of each file part, or None if it is not seekable
+        self._start_positions: List[Optional[int]] = []
+        # Length of each file part, or None if it cannot be determined
+        self._file_lengths: List[Optional[int]] = []
+        self._consumed = False
+        # SHA-1 hashes of the file parts sent so far
+        self.file_hashes: List[str] = []
+        for name, content, content_type in fields:
+            header = (
+                b"--%b%b"
+                b'Content-Disposition: form-data; name="%b"%b'
+                b"Content-Type: %b%b%b"
+                % (
+                    self.boundary.encode("ascii"),
+                    NEWLINE,
+                    name.encode("ascii"),
+                    NEWLINE,
+                    content_type.encode("ascii"),
+                    NEWLINE,
+                    NEWLINE,
+                )
+            )
+            self._parts.append((header, content))
+            if not isinstance(content, bytes):
+                self._start_positions.append(_tell(content))
+        self._trailer = b"--%b--%b" % (self.boundary.encode("ascii"), NEWLINE)
+        # requests looks up the body length from the `len` attribute.
+        self.len = self._compute_length()
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _compute_length(self) -> Optional[int]:
+        length: Optional[int] = len(self._trailer)
+        for header, content in self._parts:
+            part_length = len(header) + len(NEWLINE)
+            if isinstance(content, bytes):
+                part_length += len(content)
+            else:
+                # File parts are sent with exactly this length, so the body
+                # matches its Content-Length even if the file changes.
+                content_length = remaining_length(content)
+                self._file_lengths.append(content_length)
+                if content_length is None:
+                    length = None
+                    continue
+                part_length += content_length
+            if length is not None:
+                length += part_length
+        return length
+
+    def rewind(self) -> None:
+        """Prepare the body to be sent again"""
+        if not self._consumed:
+            return
+        files = [
+            content for _, content in self._parts if not isinstance(content, bytes)
+        ]
+        for file, position in zip(files, self._start_positions):
+            if position is None:
+                raise UnrewindableBodyError("Unable to rewind multipart body")
+            try:
+                file.seek(position)
+            except (OSError, ValueError) as err:
+                raise UnrewindableBodyError("Unable to rewind multipart body") from err
+        self._consumed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        # Sending the body again without rewinding it would send the file
+        # parts truncated.
+        if self._consumed:
+            raise UnrewindableBodyError("Multipart body has already been sent")
+        self._consumed = True
+        self.file_hashes = []
+        file_lengths = iter(self._file_lengths)
+        for header, content in self._parts:
+            if isinstance(content, bytes):
+                yield header + content + NEWLINE
+                continue
+            yield header
+            digest = hashlib.sha1()
+            for data in self._read_file(content, next(file_lengths)):
+                digest.update(data)
+                yield data
+            self.file_hashes.append(digest.hexdigest())
+            yield NEWLINE
+        yield self._trailer
+
+    def _read_file(self, file: BinaryIO, length: Optional[int]) -> Iterator[bytes]:
+        if length is None:
+            while True:
+                data = file.read(self.chunk_size)
+                if not data:
+                    return
+                yield data
+        remaining = length
+        while remaining > 0:
+            data = file.read(min(self.chunk_size, remaining))
+            if not data:
+                raise FileChangedError(
+                    f"File ended {remaining} bytes before its expected length"
+                )
+            remaining -= len(data)
+            yield data
@@ -0,0 +1,409 @@
+import hashlib
+import itertools
+import logging
+import os
+import threading
+from concurrent import futures
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from datetime import datetime
+from pathlib import Path
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .poll import PollFunction, PollScheduler
+from .scan import (
+    ContentHashMismatchError,
+    ScanContentMetadata,
+    ScanMetadata,
+    ScanResponse,
+    ScanStatus,
+)
+from .state import ScanStateIndex
+
+# Size of the pieces in which files are read while hashing them.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Default number of threads for each stage of the pipeline.
+DEFAULT_HASH_WORKERS = os.cpu_count() or 1
+DEFAULT_LOOKUP_WORKERS = 32
+DEFAULT_UPLOAD_WORKERS = 8
+
+# Default maximum number of files being scanned at the same time.
+DEFAULT_MAX_PENDING = 1024
+
+
+class Scanner(Protocol):
+    def scan(
+        self,
+        metadata: ScanMetadata,
+        file: Optional[BinaryIO] = None,
+    ) -> ScanResponse:
+        ...
+
+    def scan_hash(self, sha1: str) -> ScanResponse:
+        ...
+
+    def poll(self, poll_path: str) -> ScanResponse:
+        ...
+
+
+@dataclass
+class FileScanResult:
+    path: Path
+    hash: str
+    result: ScanResponse
+
+
+def shared_client_factory(factory: Callable[[], Scanner]) -> Callable[[], Scanner]:
+    """Wrap a client factory so that all threads share a single client.
+
+    The client is created by `factory` when it is first needed, so the setup
+    of the client and its authenticator happens once for all threads instead
+    of once in each of them.
+    """
+    lock = threading.Lock()
+    clients: List[Scanner] = []
+
+    def get_client() -> Scanner:
+        with lock:
+            if not clients:
+                clients.append(factory())
+            return clients[0]
+
+    return get_client
+
+
+def hash_file(path: Path, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """Compute SHA-1 hash of a file without reading it fully into memory"""
+    digest = hashlib.sha1()
+    with path.open("rb") as handle:
+        while data := handle.read(chunk_size):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+@dataclass
+class _ScanTaskResult:
+    response: ScanResponse
+    # Function for polling the scan if it is still pending
+    poll: PollFunction
+    # Hash of the uploaded content if the file changed after it was hashed
+    changed_hash: Optional[str] = None
+
+
+@dataclass
+class _HashedFile:
+    path: Path
+    hash: str
+    # File metadata and definition update time, if scan state is recorded
+    stat: Optional[os.stat_result] = None
+    definition_update: Optional[datetime] = None
+    # Verdict from a previous scan that is still valid, if any
+    previous: Optional[ScanResponse] = None
+
+
+@dataclass
+class _HashContext:
+    path: Path
+
+
+@dataclass
+class _LookupContext:
+    file: _HashedFile
+
+
+@dataclass
+class _UploadContext:
+    file: _HashedFile
+
+
+@dataclass
+class _PollContext:
+    file: _HashedFile
+    uploaded: bool
+
+
+_Context = Union[_HashContext, _LookupContext, _UploadContext, _PollContext]
+
+
+class ScanPipeline:
+    """Scans files first by their hash and then by their content if needed.
+
+    Files are scanned in stages, each running in its own pool of threads:
+
+    1. Files are hashed, reading them in pieces of `hash_chunk_size` bytes.
+    2. Atlant is asked for a verdict using the hash alone.
+    3. Files for which the hash is not enough to conclusively identify the file
+       (Atlant sets the 'need_content' warning) are uploaded for a full scan.
+
+    Scans that are still pending are polled by a shared poll scheduler, so no
+    stage has threads sleeping while Atlant is analysing the content.
+
+    At most `max_pending` files are being scanned at any time. Files are taken
+    from the iterable given to `scan` only when there is room for them, so
+    memory use does not grow with the number of files.
+
+    If `state` is given, files whose metadata or hash have not changed since
+    they were last scanned are not scanned again, as long as their verdict is
+    still valid for the latest definitions.
+
+    `client_factory` is called once in each scanning thread to create the
+    client used by that thread. Clients that can be used from many threads
+    at once can be shared by wrapping their factory with
+    `shared_client_factory`.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Scanner],
+        *,
+        hash_workers: int = DEFAULT_HASH_WORKERS,
+        lookup_workers: int = DEFAULT_LOOKUP_WORKERS,
+        upload_workers: int = DEFAULT_UPLOAD_WORKERS,
+        hash_chunk_size: int = HASH_CHUNK_SIZE,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        poll_scheduler: Optional[PollScheduler] = None,
+        state: Optional[ScanStateIndex] = None,
+    ):
+        self.client_factory = client_factory
+        self.hash_workers = hash_workers
+        self.lookup_workers = lookup_workers
+        self.upload_workers = upload_workers
+        self.hash_chunk_size = hash_chunk_size
+        self.max_pending = max_pending
+        self.poll_scheduler = poll_scheduler
+        self.state = state
+        self._thread_context = threading.local()
+
+    def _initialize_thread(self) -> None:
+        logging.debug("Initializing scanner thread.")
+        self._thread_context.client = self.client_factory()
+
+    def _hash(self, path: Path) -> _HashedFile:
+        if self.state is None:
+            logging.debug(f"Hashing {path}.")
+            return _HashedFile(path, hash_file(path, self.hash_chunk_size))
+        stat = path.stat()
+        definition_update = self.state.latest_definition_update()
+        previous = self.state.lookup(path, stat, definition_update)
+        if previous is not None:
+            logging.debug(f"Skipping unchanged file {path}.")
+            return _HashedFile(
+                path, previous.sha1, stat, definition_update, previous.response
+            )
+        logging.debug(f"Hashing {path}.")
+        hash = hash_file(path, self.hash_chunk_size)
+        previous_response = self.state.lookup_hash(path, hash, definition_update)
+        if previous_response is not None:
+            # Only the metadata changed, for example because the file was
+            # touched. The new metadata is recorded so that the file is not
+            # hashed again on later scans.
+            self.state.record(path, stat, hash, previous_response, definition_update)
+        return _HashedFile(path, hash, stat, definition_update, previous_response)
+
+    def _lookup(self, hash: str) -> _ScanTaskResult:
+        client: Scanner = self._thread_context.client
+        return _ScanTaskResult(client.scan_hash(hash), client.poll)
+
+    def _upload(self, path: Path, hash: str) -> _ScanTaskResult:
+        logging.debug(f"Scanning {path} using its content.")
+        client: Scanner = self._thread_context.client
+        # The hash is included so that the verdict can be cached by it.
+        scan_metadata = ScanMetadata(content_meta=ScanContentMetadata(sha1=hash))
+        with path.open("rb") as handle:
+            try:
+                return _ScanTaskResult(client.scan(scan_metadata, handle), client.poll)
+            except ContentHashMismatchError as err:
+                logging.warning(f"{path} changed while it was being scanned.")
+                return _ScanTaskResult(err.response, client.poll, err.sha1)
+
+    def scan(self, files: Iterable[Path]) -> Iterator[FileScanResult]:
+        """Scan files, yielding results in the order the scans complete"""
+        with futures.ThreadPoolExecutor(
+            max_workers=self.hash_workers,
+            thread_name_prefix="HashThread",
+        ) as hash_pool, futures.ThreadPoolExecutor(
+            max_workers=self.lookup_workers,
+            thread_name_prefix="LookupThread",
+            initializer=self._initialize_thread,
+        ) as lookup_pool, futures.ThreadPoolExecutor(
+            max_workers=self.upload_workers,
+            thread_name_prefix="UploadThread",
+            initializer=self._initialize_thread,
+        ) as upload_pool, _scheduler(
+            self.poll_scheduler
+        ) as poll_scheduler:
+            task_contexts: Dict["futures.Future[Any]", _Context] = {}
+            tasks: Set["futures.Future[Any]"] = set()
+
+            def submit(future: "futures.Future[Any]", context: _Context) -> None:
+                task_contexts[future] = context
+                tasks.add(future)
+
+            def complete(
+                file: _HashedFile,
+                response: ScanResponse,
+                poll: Optional[PollFunction],
+                uploaded: bool,
+            ) -> Optional[FileScanResult]:
+                if response.status == ScanStatus.PENDING:
+                    assert response.poll_settings is not None and poll is not None
+                    submit(
+                        poll_scheduler.submit(poll, response.poll_settings),
+                        _PollContext(file, uploaded),
+                    )
+                    return None
+                # If the need_content flag is set in the response it means the
+                # result from the hash based scan is not conclusive and the
+                # file should be submitted for a full scan.
+                if not uploaded and response.warnings.need_content:
+                    logging.debug(f"Submitting {file.path} for a content scan.")
+                    submit(
+                        upload_pool.submit(self._upload, file.path, file.hash),
+                        _UploadContext(file),
+                    )
+                    return None
+                # Files that changed after they were hashed are not recorded,
+                # as their recorded metadata would not match their content.
+                if self.state is not None and file.stat is not None:
+                    assert file.definition_update is not None
+                    self.state.record(
+                        file.path,
+                        file.stat,
+                        file.hash,
+                        response,
+                        file.definition_update,
+                    )
+                return FileScanResult(path=file.path, hash=file.hash, result=response)
+
+            # Each file being scanned has exactly one task at a time, so the
+            # number of tasks is the number of files being scanned.
+            pending_files = iter(files)
+
+            def submit_files() -> None:
+                for path in itertools.islice(
+                    pending_files, max(0, self.max_pending - len(tasks))
+                ):
+                    submit(hash_pool.submit(self._hash, path), _HashContext(path))
+
+            submit_files()
+            while tasks:
+                finished_tasks, tasks = futures.wait(
+                    tasks,
+                    return_when=futures.FIRST_COMPLETED,
+                )
+                for finished in finished_tasks:
+                    context = task_contexts.pop(finished)
+                    result: Optional[FileScanResult] = None
+                    if isinstance(context, _HashContext):
+                        file: _HashedFile = finished.result()
+                        if file.previous is not None:
+                            result = FileScanResult(
+                                path=file.path,
+                                hash=file.hash,
+                                result=file.previous,
+                            )
+                        else:
+                            logging.debug(f"Scanning {file.path} using its hash.")
+                            submit(
+                                lookup_pool.submit(self._lookup, file.hash),
+                                _LookupContext(file),
+                            )
+                    elif isinstance(context, (_LookupContext, _UploadContext)):
+                        task_result: _ScanTaskResult = finished.result()
+                        file = context.file
+                        if task_result.changed_hash is not None:
+                            file = replace(
+                                file, hash=task_result.changed_hash, stat=None
+                            )
+                        result = complete(
+                            file,
+                            task_result.response,
+                            task_result.poll,
+                            isinstance(context, _UploadContext),
+                        )
+                    elif isinstance(context, _PollContext):
+                        # Polled scans are always complete.
+                        result = complete(
+                            context.file,
+                            finished.result(),
+                            None,
+                            context.uploaded,
+                        )
+                    else:
+                        assert False
+                    if result is not None:
+                        yield result
+                submit_files()
+
+
+def scan_hashes(
+    client: Scanner,
+    hashes: Iterable[str],
+    *,
+    workers: int = DEFAULT_LOOKUP_WORKERS,
+    max_pending: int = DEFAULT_MAX_PENDING,
+    poll_scheduler: Optional[PollScheduler] = None,
+) -> Iterator[Tuple[str, ScanResponse]]:
+    """Scan content by SHA-1 hashes, yielding hashes with their verdicts.
+
+    Up to `workers` lookups are performed at the same time, each thread
+    reusing the keep-alive connections of the client's session, and at most
+    `max_pending` hashes are being scanned at any time. Results are yielded
+    in the order the scans complete, not in the order of `hashes`. Responses
+    can have the 'need_content' warning set, in which case the hash was not
+    enough to conclusively identify the content.
+
+    `client` is used from all the threads at the same time.
+    """
+    with futures.ThreadPoolExecutor(
+        max_workers=workers,
+        thread_name_prefix="LookupThread",
+    ) as lookup_pool, _scheduler(poll_scheduler) as poll_scheduler:
+        task_hashes: Dict["futures.Future[ScanResponse]", str] = {}
+        pending_hashes = iter(hashes)
+
+        def submit_hashes() -> None:
+            for hash in itertools.islice(
+                pending_hashes, max(0, max_pending - len(task_hashes))
+            ):
+                task_hashes[lookup_pool.submit(client.scan_hash, hash)] = hash
+
+        submit_hashes()
+        while task_hashes:
+            finished_tasks, _ = futures.wait(
+                task_hashes,
+                return_when=futures.FIRST_COMPLETED,
+            )
+            for finished in finished_tasks:
+                hash = task_hashes.pop(finished)
+                response = finished.result()
+                if response.status == ScanStatus.PENDING:
+                    assert response.poll_settings is not None
+                    poll = poll_scheduler.submit(client.poll, response.poll_settings)
+                    task_hashes[poll] = hash
+                    continue
+                yield hash, response
+            submit_hashes()
+
+
+@contextmanager
+def _scheduler(scheduler: Optional[PollScheduler]) -> Iterator[PollScheduler]:
+    if scheduler is not None:
+        yield scheduler
+        return
+    with PollScheduler() as scheduler:
+        yield scheduler
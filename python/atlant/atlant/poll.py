@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent import futures
+from dataclasses import dataclass, field
+from types import TracebackType
+from typing import Callable, List, Optional, Type
+
+from .scan import PollSettings, ScanResponse, ScanStatus
+
+# Default maximum number of polls performed at the same time.
+DEFAULT_MAX_IN_FLIGHT = 8
+
+# Default maximum random delay added to each poll, as a fraction of the
+# retry delay requested by Atlant.
+DEFAULT_JITTER = 0.1
+
+PollFunction = Callable[[str], ScanResponse]
+
+
+@dataclass(order=True)
+class _ScheduledPoll:
+    deadline: float
+    sequence: int
+    poll: PollFunction = field(compare=False)
+    settings: PollSettings = field(compare=False)
+    future: "futures.Future[ScanResponse]" = field(compare=False)
+
+
+class PollScheduler:
+    """Polls pending scans until they are completed.
+
+    Pending scans are kept in a heap ordered by the time of their next poll, and
+    a single scheduler thread sleeps until the earliest poll is due. Due polls
+    are performed concurrently by a pool of at most `max_in_flight` threads, so
+    no thread is kept sleeping while Atlant is still analysing the content.
+
+    Each submitted scan is represented by a future that is resolved with the
+    completed scan response. Cancelling the future stops polling the scan.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        jitter: float = DEFAULT_JITTER,
+    ):
+        self.jitter = jitter
+        self._heap: List[_ScheduledPoll] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._executor = futures.ThreadPoolExecutor(
+            max_workers=max_in_flight,
+            thread_name_prefix="PollThread",
+        )
+        self._thread = threading.Thread(
+            target=self._run,
+            name="PollScheduler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def submit(
+        self,
+        poll: PollFunction,
+        settings: PollSettings,
+    ) -> "futures.Future[ScanResponse]":
+        """Poll a pending scan using `poll` until it is completed"""
+        future: "futures.Future[ScanResponse]" = futures.Future()
+        self._schedule(poll, settings, future)
+        return future
+
+    def _schedule(
+        self,
+        poll: PollFunction,
+        settings: PollSettings,
+        future: "futures.Future[ScanResponse]",
+    ) -> None:
+        delay = settings.retry_after * (1 + random.uniform(0, self.jitter))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot schedule polls after closing scheduler")
+            entry = _ScheduledPoll(
+                deadline=time.monotonic() + delay,
+                sequence=next(self._sequence),
+                poll=poll,
+                settings=settings,
+                future=future,
+            )
+            heapq.heappush(self._heap, entry)
+            # Wake up the scheduler thread if the new poll is the earliest one.
+            if self._heap[0] is entry:
+                self._condition.notify()
+
+    def _run(self) -> None:
+        with self._condition:
+            while not self._closed:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                timeout = self._heap[0].deadline - time.monotonic()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+                entry = heapq.heappop(self._heap)
+                if entry.future.cancelled():
+                    continue
+                self._executor.submit(self._poll, entry)
+
+    def _poll(self, entry: _ScheduledPoll) -> None:
+        if entry.future.cancelled():
+            return
+        try:
+            response = entry.poll(entry.settings.poll_path)
+        except BaseException as err:
+            self._resolve(entry.future, exception=err)
+            return
+        if response.status == ScanStatus.COMPLETE:
+            self._resolve(entry.future, response=response)
+            return
+        logging.debug(f"Scan {entry.settings.poll_path} is still pending.")
+        settings = response.poll_settings or entry.settings
+        try:
+            self._schedule(entry.poll, settings, entry.future)
+        except RuntimeError as err:
+            self._resolve(entry.future, exception=err)
+
+    @staticmethod
+    def _resolve(
+        future: "futures.Future[ScanResponse]",
+        *,
+        response: Optional[ScanResponse] = None,
+        exception: Optional[BaseException] = None,
+    ) -> None:
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                assert response is not None
+                future.set_result(response)
+        except futures.InvalidStateError:
+            # The future was cancelled while the poll was in progress.
+            pass
+
+    def close(self) -> None:
+        """Stop polling and cancel all scans that are still pending"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            entries, self._heap = self._heap, []
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+        for entry in entries:
+            entry.future.cancel()
+
+    def __enter__(self) -> "PollScheduler":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
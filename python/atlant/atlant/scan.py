@@ -1,15 +1,45 @@
 import logging
+import re
+import shutil
+import tempfile
 import time
 import urllib.parse
+from contextlib import ExitStack
 from enum import Enum
 from functools import cached_property
-from typing import BinaryIO, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
 import requests
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from .auth import AuthenticatorBase
 from .common import APIException
+from .multipart import (
+    DEFAULT_CHUNK_SIZE,
+    Field,
+    FileChangedError,
+    MultipartEncoder,
+    remaining_length,
+)
+from .serialization import dumps, loads
+
+SHA1_PATTERN = re.compile(r"[0-9a-fA-F]{40}")
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# Hash used in place of the actual hash when serializing hash lookup templates.
+_PLACEHOLDER_SHA1 = "0" * 40
 
 
 class ScanStatus(Enum):
@@ -80,12 +110,26 @@ class ScanResponse(BaseModel):
     poll_settings: Optional[PollSettings] = None
 
 
-class SecurityCloudSettings(BaseModel):
+class _FrozenModel(BaseModel):
+    class Config:
+        frozen = True
+        # Immutable models can be shared instead of copied when used as
+        # fields of other models.
+        copy_on_model_validation = "none"
+
+
+class SecurityCloudSettings(_FrozenModel):
     allow_upstream_application_files: Optional[bool] = None
     allow_upstream_data_files: Optional[bool] = None
 
 
-class ScanSettings(BaseModel):
+class ScanSettings(_FrozenModel):
+    """Scan settings.
+
+    Settings are immutable, so the same settings can be shared by any number
+    of scans and are serialized only once.
+    """
+
     scan_archives: Optional[bool] = None
     max_nested: Optional[int] = None
     max_scan_time: Optional[int] = None
@@ -93,11 +137,19 @@ class ScanSettings(BaseModel):
     allow_upstream_metadata: Optional[bool] = None
     antispam: Optional[bool] = None
     scan_embedded_urls: Optional[bool] = None
-    forbidden_uri_categories: Optional[List[str]] = None
+    forbidden_uri_categories: Optional[Tuple[str, ...]] = None
     security_cloud: Optional[SecurityCloudSettings] = None
 
+    _encoded: Optional[bytes] = PrivateAttr(None)
 
-class ScanContentMetadata(BaseModel):
+    def encode(self) -> bytes:
+        """Serialize as UTF-8 encoded JSON"""
+        if self._encoded is None:
+            self._encoded = self.json().encode("utf-8")
+        return self._encoded
+
+
+class ScanContentMetadata(_FrozenModel):
     sha1: Optional[str] = None
     uri: Optional[str] = None
     content_length: Optional[int] = None
@@ -105,13 +157,196 @@ class ScanContentMetadata(BaseModel):
     charset: Optional[str] = None
     ip: Optional[str] = None
     sender: Optional[str] = None
-    recipients: Optional[List[str]] = None
+    recipients: Optional[Tuple[str, ...]] = None
+
+    def encode(self) -> bytes:
+        """Serialize as UTF-8 encoded JSON"""
+        # All fields are plain JSON values, so they can be serialized without
+        # going through pydantic.
+        return dumps(self.__dict__)
 
 
-class ScanMetadata(BaseModel):
+class ScanMetadata(_FrozenModel):
+    """Metadata of a scan.
+
+    Metadata is immutable and serialized only once. The serialized scan
+    settings are shared by all metadata using the same settings, so only the
+    content metadata is serialized for each scan.
+    """
+
     scan_settings: Optional[ScanSettings] = None
     content_meta: Optional[ScanContentMetadata] = None
 
+    _encoded: Optional[bytes] = PrivateAttr(None)
+
+    def encode(self) -> bytes:
+        """Serialize as UTF-8 encoded JSON"""
+        if self._encoded is None:
+            self._encoded = b'{"scan_settings":%b,"content_meta":%b}' % (
+                self.scan_settings.encode() if self.scan_settings else b"null",
+                self.content_meta.encode() if self.content_meta else b"null",
+            )
+        return self._encoded
+
+
+def validate_sha1(sha1: str) -> str:
+    if not SHA1_PATTERN.fullmatch(sha1):
+        raise ValueError(f"Invalid SHA-1 hash: {sha1!r}")
+    return sha1
+
+
+class HashLookupTemplate:
+    """Pre-serialized body of scan requests identifying content by its hash.
+
+    The metadata and multipart encoding are the same for all hash lookups
+    apart from the hash itself, so they are serialized once and each request
+    body is built by inserting the hash between the serialized pieces.
+    """
+
+    def __init__(self) -> None:
+        metadata = ScanMetadata(
+            content_meta=ScanContentMetadata(sha1=_PLACEHOLDER_SHA1),
+        )
+        encoder = MultipartEncoder(
+            [("metadata", metadata.encode(), "application/json")]
+        )
+        self.content_type = encoder.content_type
+        self._prefix, self._suffix = b"".join(encoder).split(
+            _PLACEHOLDER_SHA1.encode("ascii")
+        )
+
+    def body(self, sha1: str) -> bytes:
+        return self._prefix + validate_sha1(sha1).encode("ascii") + self._suffix
+
+
+def _construct(model: Type[ModelT], values: Dict[str, Any]) -> ModelT:
+    # Equivalent to `model.construct(**values)`, but without copying field
+    # defaults, which are all immutable in the response models.
+    instance = model.__new__(model)
+    object.__setattr__(
+        instance,
+        "__dict__",
+        {
+            name: values[name] if name in values else field.default
+            for name, field in model.__fields__.items()
+        },
+    )
+    object.__setattr__(instance, "__fields_set__", set(values))
+    return instance
+
+
+def _construct_detection(data: Mapping[str, Any]) -> Detection:
+    values: Dict[str, Any] = {
+        "category": DetectionCategory(data["category"]),
+        "name": data["name"],
+    }
+    if type(values["name"]) is not str:
+        raise TypeError("name")
+    if "member_name" in data:
+        member_name = data["member_name"]
+        if member_name is not None and type(member_name) is not str:
+            raise TypeError("member_name")
+        values["member_name"] = member_name
+    return _construct(Detection, values)
+
+
+def _construct_scan_response(
+    data: Mapping[str, Any],
+    poll_settings: Optional[PollSettings],
+) -> ScanResponse:
+    warnings = data["warnings"]
+    if not warnings.keys() <= ScanWarnings.__fields__.keys() or any(
+        type(value) is not bool for value in warnings.values()
+    ):
+        raise TypeError("warnings")
+    values: Dict[str, Any] = {
+        "status": ScanStatus(data["status"]),
+        "scan_result": ScanResult(data["scan_result"]),
+        "detections": [
+            _construct_detection(detection) for detection in data["detections"]
+        ],
+        "warnings": _construct(ScanWarnings, warnings),
+    }
+    if "uri_categories" in data:
+        uri_categories = data["uri_categories"]
+        if uri_categories is not None and (
+            type(uri_categories) is not list
+            or any(type(category) is not str for category in uri_categories)
+        ):
+            raise TypeError("uri_categories")
+        values["uri_categories"] = uri_categories
+    if poll_settings is not None:
+        values["poll_settings"] = poll_settings
+    return _construct(ScanResponse, values)
+
+
+def scan_response_from_json(
+    data: Any,
+    poll_settings: Optional[PollSettings] = None,
+) -> ScanResponse:
+    """Build a scan response from its decoded JSON representation.
+
+    Responses of the expected shape are built without running pydantic
+    validation, which is several times faster for responses of hash lookups.
+    Anything else is validated as usual, so invalid responses raise the same
+    errors as when constructing `ScanResponse` directly.
+    """
+    try:
+        return _construct_scan_response(data, poll_settings)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        if poll_settings is not None:
+            return ScanResponse(**data, poll_settings=poll_settings)
+        return ScanResponse(**data)
+
+
+def parse_scan_response(
+    status_code: int,
+    headers: Mapping[str, str],
+    json: Callable[[], Any],
+) -> ScanResponse:
+    """Build a scan response from the HTTP response of a scan request"""
+    if status_code == 200:
+        return scan_response_from_json(json())
+    elif status_code == 202:
+        # If status code is 202 the scan is not complete and client should poll for updates
+        poll_path = headers["Location"]
+        retry_after = int(headers["Retry-After"])
+        poll_settings = PollSettings(
+            poll_path=poll_path,
+            retry_after=retry_after,
+        )
+        return scan_response_from_json(json(), poll_settings)
+    else:
+        raise APIException(
+            "Scan error",
+            f"Received unexpected response status {status_code}",
+        )
+
+
+def parse_poll_response(status_code: int, json: Callable[[], Any]) -> ScanResponse:
+    """Build a scan response from the HTTP response of a poll request"""
+    if status_code == 200:
+        return scan_response_from_json(json())
+    raise APIException(
+        "Scan error",
+        f"Received unexpected response status {status_code}",
+    )
+
+
+class ContentHashMismatchError(FileChangedError):
+    """Uploaded content does not match the SHA-1 hash in the scan metadata.
+
+    `response` is the response to the scan of the uploaded content, and `sha1`
+    is the hash of that content.
+    """
+
+    def __init__(self, expected: str, sha1: str, response: "ScanResponse"):
+        super().__init__(
+            f"Uploaded content has SHA-1 hash {sha1} instead of {expected}"
+        )
+        self.sha1 = sha1
+        self.response = response
+
 
 class ScanClient:
     def __init__(
@@ -128,41 +363,82 @@ class ScanClient:
     def scan_url(self) -> str:
         return urllib.parse.urljoin(self.service_url, "api/scan/v1")
 
+    @cached_property
+    def status_url(self) -> str:
+        return urllib.parse.urljoin(self.service_url, "api/status/v1")
+
     def scan(
         self,
         metadata: ScanMetadata,
         file: Optional[BinaryIO] = None,
     ) -> ScanResponse:
         """Perform a scan"""
-        FormData = List[Tuple[str, Tuple[Optional[str], Union[str, BinaryIO], str]]]
-        form_data: FormData = [
-            ("metadata", (None, metadata.json(), "application/json")),
-        ]
-        if file is not None:
-            form_data.append(
-                ("data", (None, file, "application/octet-stream")),
+        with ExitStack() as stack:
+            fields: List[Field] = [
+                ("metadata", metadata.encode(), "application/json"),
+            ]
+            if file is not None:
+                if remaining_length(file) is None:
+                    # Content of unknown length (such as a pipe) is copied to a
+                    # temporary file first, so that the request can be sent
+                    # with a Content-Length header.
+                    spooled = stack.enter_context(tempfile.TemporaryFile())
+                    shutil.copyfileobj(file, spooled, DEFAULT_CHUNK_SIZE)
+                    spooled.seek(0)
+                    file = spooled
+                fields.append(("data", file, "application/octet-stream"))
+            encoder = MultipartEncoder(fields)
+            request = requests.Request(
+                "POST",
+                self.scan_url,
+                headers={"Content-Type": encoder.content_type},
+                data=encoder,
             )
-        request = requests.Request("POST", self.scan_url, files=form_data)
+            if file is not None:
+                # Checking the credentials first avoids uploading the content
+                # again if the credentials are rejected.
+                response = self.authenticator.perform_upload(
+                    self.session,
+                    request,
+                    requests.Request("GET", self.status_url),
+                )
+            else:
+                response = self.authenticator.perform_request(self.session, request)
+        result = parse_scan_response(
+            response.status_code, response.headers, lambda: loads(response.content)
+        )
+        # The content may have changed after it was hashed, in which case the
+        # response is not a verdict for the hash given in the metadata.
+        expected = (
+            metadata.content_meta.sha1 if metadata.content_meta is not None else None
+        )
+        if file is not None and expected is not None:
+            (sha1,) = encoder.file_hashes
+            if sha1 != expected.lower():
+                raise ContentHashMismatchError(expected, sha1, result)
+        return result
+
+    @cached_property
+    def hash_lookup_template(self) -> HashLookupTemplate:
+        return HashLookupTemplate()
+
+    def scan_hash(self, sha1: str) -> ScanResponse:
+        """Perform a scan identifying the content by its SHA-1 hash only.
+
+        This is equivalent to scanning with metadata holding only the hash, but
+        the request body is built from a template serialized once per client.
+        """
+        template = self.hash_lookup_template
+        request = requests.Request(
+            "POST",
+            self.scan_url,
+            headers={"Content-Type": template.content_type},
+            data=template.body(sha1),
+        )
         response = self.authenticator.perform_request(self.session, request)
-        if response.status_code == 200:
-            return ScanResponse(**response.json())
-        elif response.status_code == 202:
-            # If status code is 202 the scan is not complete and client should poll for updates
-            poll_path = response.headers["Location"]
-            retry_after = int(response.headers["Retry-After"])
-            poll_settings = PollSettings(
-                poll_path=poll_path,
-                retry_after=retry_after,
-            )
-            return ScanResponse(
-                **response.json(),
-                poll_settings=poll_settings,
-            )
-        else:
-            raise APIException(
-                "Scan error",
-                f"Received unexpected response status {response.status_code}",
-            )
+        return parse_scan_response(
+            response.status_code, response.headers, lambda: loads(response.content)
+        )
 
     def url_for_poll_path(self, poll_path: str) -> str:
         return urllib.parse.urljoin(self.service_url, poll_path)
@@ -171,11 +447,8 @@ class ScanClient:
         """Poll a pending scan task"""
         request = requests.Request("GET", self.url_for_poll_path(poll_path))
         response = self.authenticator.perform_request(self.session, request)
-        if response.status_code == 200:
-            return ScanResponse(**response.json())
-        raise APIException(
-            "Scan error",
-            f"Received unexpected response status {response.status_code}",
+        return parse_poll_response(
+            response.status_code, lambda: loads(response.content)
         )
 
     def scan_until_completion(
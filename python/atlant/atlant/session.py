@@ -0,0 +1,77 @@
+from typing import Any, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter, Retry
+
+# Defaults used by requests.
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_MAX_CONNECTIONS = 10
+
+Timeout = Tuple[Optional[float], Optional[float]]
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTP adapter applying default connect and read timeouts to requests"""
+
+    def __init__(self, *args: Any, timeout: Optional[Timeout] = None, **kwargs: Any):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(  # type: ignore[override]
+        self,
+        request: requests.PreparedRequest,
+        timeout: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> requests.Response:
+        if timeout is None:
+            timeout = self.timeout
+        # Timeouts with only a read timeout are supported by urllib3 even
+        # though they are not accepted by the type stubs.
+        return super().send(
+            request, timeout=timeout, **kwargs  # type: ignore[arg-type]
+        )
+
+
+def configure_session(
+    session: requests.Session,
+    *,
+    # Number of hosts for which connection pools are kept
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+    # Maximum number of connections kept open to each host
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    # Whether connections are reused between requests
+    keep_alive: bool = True,
+    # Timeout in seconds for establishing connections
+    connect_timeout: Optional[float] = None,
+    # Timeout in seconds for receiving data from the server
+    read_timeout: Optional[float] = None,
+    # Number of times failed connection attempts are retried
+    retries: int = 0,
+    # Backoff factor for delays between retries
+    retry_backoff: float = 0,
+) -> None:
+    """Configure connection pooling, timeouts and retries of a session.
+
+    Connections are kept alive and reused by default, so TLS handshakes are
+    performed once per connection and not once per request. `max_connections`
+    should be at least the number of threads sharing the session, as requests
+    beyond that open connections that are closed after use.
+    """
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=max_connections,
+        # Requests are retried only on errors that occur before the request
+        # has been sent, as scan requests must not be sent twice.
+        max_retries=Retry(
+            total=retries,
+            read=False,
+            status=0,
+            backoff_factor=retry_backoff,
+            raise_on_status=False,
+        ),
+        timeout=(connect_timeout, read_timeout),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not keep_alive:
+        session.headers["Connection"] = "close"
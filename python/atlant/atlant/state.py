@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Union
+
+from .cache import DefinitionUpdateTracker
+from .scan import ScanResponse, scan_response_from_json
+from .serialization import loads
+
+# Number of recorded files after which changes are committed to the database.
+COMMIT_INTERVAL = 1000
+
+
+@dataclass
+class FileState:
+    sha1: str
+    response: ScanResponse
+
+
+class ScanStateIndex:
+    """Index of previously scanned files for incremental scanning.
+
+    The index records the size, modification time, inode, SHA-1 hash and
+    verdict of each scanned file, along with the time of the latest definition
+    update when the file was scanned. Verdicts are only reused as long as no
+    definition update has happened since.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        definitions: DefinitionUpdateTracker,
+    ):
+        self.definitions = definitions
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, "
+                "size INTEGER NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, "
+                "inode INTEGER NOT NULL, "
+                "sha1 TEXT NOT NULL, "
+                "response TEXT NOT NULL, "
+                "definition_update TEXT NOT NULL)"
+            )
+
+    def latest_definition_update(self) -> datetime:
+        return self.definitions.latest()
+
+    def lookup(
+        self,
+        path: Path,
+        stat: os.stat_result,
+        definition_update: datetime,
+    ) -> Optional[FileState]:
+        """Look up the state of a file whose metadata has not changed"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT sha1, response FROM files "
+                "WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ? "
+                "AND definition_update = ?",
+                (
+                    str(path),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    stat.st_ino,
+                    definition_update.isoformat(),
+                ),
+            ).fetchone()
+        if row is None:
+            return None
+        sha1, response = row
+        return FileState(sha1=sha1, response=scan_response_from_json(loads(response)))
+
+    def lookup_hash(
+        self,
+        path: Path,
+        sha1: str,
+        definition_update: datetime,
+    ) -> Optional[ScanResponse]:
+        """Look up the verdict of a file whose content has not changed"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response FROM files "
+                "WHERE path = ? AND sha1 = ? AND definition_update = ?",
+                (str(path), sha1, definition_update.isoformat()),
+            ).fetchone()
+        if row is None:
+            return None
+        return scan_response_from_json(loads(row[0]))
+
+    def record(
+        self,
+        path: Path,
+        stat: os.stat_result,
+        sha1: str,
+        response: ScanResponse,
+        definition_update: datetime,
+    ) -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(path),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    stat.st_ino,
+                    sha1,
+                    response.json(exclude={"poll_settings"}),
+                    definition_update.isoformat(),
+                ),
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= COMMIT_INTERVAL:
+                self._connection.commit()
+                self._uncommitted = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
@@ -0,0 +1,39 @@
+import urllib.parse
+from datetime import datetime
+from typing import Any, Iterable
+
+import requests
+from pydantic import parse_obj_as
+
+from .auth import AuthenticatorBase
+from .common import APIException
+
+
+class StatsClient:
+    def __init__(
+        self,
+        session: requests.Session,
+        service_url: str,
+        authenticator: AuthenticatorBase,
+    ):
+        self.session = session
+        self.service_url = service_url
+        self.authenticator = authenticator
+
+    def url_for_stat(self, path: Iterable[str]) -> str:
+        stats_base_url = urllib.parse.urljoin(self.service_url, "api/atlant/stats/v1/")
+        stat_path = "/".join(urllib.parse.quote(segment, safe="") for segment in path)
+        return urllib.parse.urljoin(stats_base_url, stat_path)
+
+    def get(self, path: Iterable[str]) -> Any:
+        request = requests.Request("GET", self.url_for_stat(path))
+        response = self.authenticator.perform_request(self.session, request)
+        data = response.json()
+        if response.status_code == 200:
+            return data
+        raise APIException(data["title"], data["message"])
+
+    def latest_definition_update_time(self) -> datetime:
+        """Time of the latest definition update"""
+        value = self.get(["latest_definition_update", "time"])
+        return parse_obj_as(datetime, value)
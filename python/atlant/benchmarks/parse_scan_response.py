@@ -0,0 +1,68 @@
+"""Compare the speed of building scan responses with and without validation.
+
+Usage: python benchmarks/parse_scan_response.py [NUMBER]
+"""
+import json
+import sys
+import timeit
+from typing import Callable, Dict
+
+from atlant.scan import ScanResponse, scan_response_from_json
+from atlant.serialization import loads, orjson
+
+RESPONSES: Dict[str, bytes] = {
+    "clean": json.dumps(
+        {
+            "status": "complete",
+            "scan_result": "clean",
+            "detections": [],
+            "warnings": {"need_content": False},
+        }
+    ).encode("utf-8"),
+    "harmful": json.dumps(
+        {
+            "status": "complete",
+            "scan_result": "harmful",
+            "detections": [
+                {
+                    "category": "harmful",
+                    "name": f"Trojan.Generic.{index}",
+                    "member_name": f"archive/file{index}.exe",
+                }
+                for index in range(10)
+            ],
+            "warnings": {"corrupted": False, "encrypted": True},
+        }
+    ).encode("utf-8"),
+}
+
+
+def pydantic_path(data: bytes) -> ScanResponse:
+    return ScanResponse(**json.loads(data))
+
+
+def fast_path(data: bytes) -> ScanResponse:
+    return scan_response_from_json(loads(data))
+
+
+def main() -> None:
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"JSON parser: {'orjson' if orjson is not None else 'json'}")
+    for name, data in RESPONSES.items():
+        assert pydantic_path(data) == fast_path(data)
+        timings: Dict[str, float] = {}
+        paths: Dict[str, Callable[[bytes], ScanResponse]] = {
+            "pydantic": pydantic_path,
+            "fast": fast_path,
+        }
+        for path_name, path in paths.items():
+            seconds = min(timeit.repeat(lambda: path(data), number=number, repeat=3))
+            timings[path_name] = seconds
+            print(
+                f"{name:>8} {path_name:>8}: {seconds / number * 1e6:6.2f} us/response"
+            )
+        print(f"{name:>8} speedup: {timings['pydantic'] / timings['fast']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
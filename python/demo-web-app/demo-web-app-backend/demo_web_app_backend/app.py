@@ -1,27 +1,51 @@
 import email.utils
 from dataclasses import dataclass
-from typing import Dict, Final, FrozenSet, List, Optional, Set
+from typing import Final, FrozenSet, List, Optional, Set
 
-from asyncio_icap_client import ICAPClient, ICAPResponse
+from asyncio_icap_client import ICAPConnectionPool, ICAPResponse
 from fastapi import FastAPI, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import AnyUrl, BaseModel, BaseSettings
 
-ICAP_HEADERS: Final[Dict[str, str]] = {
-    "Allow": "204",
-}
-
 
 class Settings(BaseSettings):
     icap_host: str
     icap_port: int = 1344
+    icap_max_connections: int = 10
+    icap_min_connections: int = 0
     cors_allowed_origins: List[str] = []
 
 
 settings = Settings()
 
+# Connections to the ICAP server are shared by all requests.
+icap_pool = ICAPConnectionPool(
+    settings.icap_host,
+    settings.icap_port,
+    min_size=settings.icap_min_connections,
+    max_size=settings.icap_max_connections,
+    health_check_path="/respmod",
+    preview=True,
+    # Allow: 204 is sent only to services that support it.
+    allow_204=True,
+    # Options are fetched when the pool is started, so that the first requests
+    # are sent with a preview too.
+    services=("/respmod", "/reqmod"),
+)
+
 app = FastAPI()
 
+
+@app.on_event("startup")
+async def start_icap_pool() -> None:
+    await icap_pool.start()
+
+
+@app.on_event("shutdown")
+async def close_icap_pool() -> None:
+    await icap_pool.close()
+
+
 if settings.cors_allowed_origins:
     app.add_middleware(
         CORSMiddleware,
@@ -77,19 +101,12 @@ class AnalyzeFileResponse(BaseModel):
 
 @app.post("/analysis/file/content/")
 async def analyze_file_contents(file: UploadFile) -> AnalyzeFileResponse:
-    async with ICAPClient(
-        settings.icap_host,
-        settings.icap_port,
-        headers=ICAP_HEADERS,
-    ) as connection:
-        icap_response = await connection.respmod(
-            "/respmod", encapsulated_response_body=file
-        )
-        response = ScanResponse.from_icap_response(icap_response)
-        return AnalyzeFileResponse(
-            verdict=response.verdict,
-            infection_name=response.infection_name,
-        )
+    icap_response = await icap_pool.respmod("/respmod", encapsulated_response_body=file)
+    response = ScanResponse.from_icap_response(icap_response)
+    return AnalyzeFileResponse(
+        verdict=response.verdict,
+        infection_name=response.infection_name,
+    )
 
 
 SHA1_LENGTH: Final[int] = 40
@@ -102,23 +119,16 @@ def is_valid_sha1(value: str) -> bool:
 
 @app.post("/analysis/file/sha1/{sha1}")
 async def analyze_file_sha1(sha1: str) -> AnalyzeFileResponse:
-    async with ICAPClient(
-        settings.icap_host,
-        settings.icap_port,
-        headers=ICAP_HEADERS,
-    ) as connection:
-        if not is_valid_sha1(sha1):
-            raise HTTPException(422, detail="Invalid SHA1 hash.")
-        icap_response = await connection.respmod(
-            "/respmod", headers={"X-Meta-SHA1": sha1}
-        )
-        response = ScanResponse.from_icap_response(icap_response)
-        if "need_content" in response.warnings:
-            return AnalyzeFileResponse(verdict="content_required")
-        return AnalyzeFileResponse(
-            verdict=response.verdict,
-            infection_name=response.infection_name,
-        )
+    if not is_valid_sha1(sha1):
+        raise HTTPException(422, detail="Invalid SHA1 hash.")
+    icap_response = await icap_pool.respmod("/respmod", headers={"X-Meta-SHA1": sha1})
+    response = ScanResponse.from_icap_response(icap_response)
+    if "need_content" in response.warnings:
+        return AnalyzeFileResponse(verdict="content_required")
+    return AnalyzeFileResponse(
+        verdict=response.verdict,
+        infection_name=response.infection_name,
+    )
 
 
 class AnalyzeUrlResponse(BaseModel):
@@ -128,14 +138,9 @@ class AnalyzeUrlResponse(BaseModel):
 
 @app.post("/analysis/url/{url:path}")
 async def analyze_url(url: AnyUrl) -> AnalyzeUrlResponse:
-    async with ICAPClient(
-        settings.icap_host,
-        settings.icap_port,
-        headers=ICAP_HEADERS,
-    ) as connection:
-        icap_response = await connection.reqmod("/reqmod", headers={"X-Meta-URI": url})
-        response = ScanResponse.from_icap_response(icap_response)
-        return AnalyzeUrlResponse(
-            verdict=response.verdict,
-            categories=response.categories,
-        )
+    icap_response = await icap_pool.reqmod("/reqmod", headers={"X-Meta-URI": url})
+    response = ScanResponse.from_icap_response(icap_response)
+    return AnalyzeUrlResponse(
+        verdict=response.verdict,
+        categories=response.categories,
+    )